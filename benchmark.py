@@ -0,0 +1,231 @@
+"""
+Benchmarks of the game engine and rendering hot paths on seeded boards.
+
+Times mine placement, worst case flood fill, the cost of one click, the win
+check and building a frame of the grid, from 9x9 boards up to 2000x2000.
+Results can be saved as JSON and compared with an earlier run, in which
+case a benchmark slower than the earlier run by more than the threshold
+fails the run:
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.25
+
+Frame benchmarks need pyglet and run in its headless mode when possible.
+"""
+import argparse
+import json
+import platform
+import random as rnd
+import statistics
+import sys
+import time
+from board import Board
+from session import GameSession
+
+SIZES = ((9, 9), (30, 16), (100, 100), (500, 500), (2000, 2000))
+DENSITY = 0.2 # Share of mines on the benchmark boards
+CLICKS = 100 # Clicks timed per board
+CHECKS = 1000 # Win checks per timed run
+
+def measure(function, repeat, setup=None):
+    """
+    Calls a function the given amount of times, calling setup untimed
+    before each call. Returns the median time of a call in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def bench_place_mines(width, height, seed, repeat):
+    """
+    Times placing the mines of a board with the first click in the middle.
+    """
+    mine_amount = max(1, int(width * height * DENSITY))
+    return measure(
+        lambda board: board.place_mines(mine_amount, seed, (width // 2, height // 2)),
+        repeat, lambda: Board(width, height)
+    )
+
+def bench_flood_fill(width, height, seed, repeat):
+    """
+    Times the worst case flood fill: one mine in a corner and a click in the
+    opposite corner, which opens every other cell of the board.
+    """
+    mines = bytearray(width * height)
+    mines[0] = 1
+    template = Board(width, height)
+    template.set_mines(mines, seed=seed)
+
+    def setup():
+        board = Board(width, height)
+        board.set_mines(template.mines, template.counts)
+        return board
+
+    return measure(lambda board: board.flood_fill(width - 1, height - 1), repeat, setup)
+
+def bench_click(width, height, seed, repeat):
+    """
+    Times one click on a safe unopened cell of a game in progress.
+    Returns the median time of a click.
+    """
+    mine_amount = max(1, int(width * height * DENSITY))
+    times = []
+    for game in range(repeat):
+        session = GameSession(width, height, mine_amount, seed + game)
+        session.reveal(width // 2, height // 2)
+        board = session.board
+        rng = rnd.Random(seed + game)
+        size = width * height
+        for _ in range(CLICKS):
+            if session.result is not None:
+                break
+            i = int(rng.random() * size)
+            while board.mines[i] or board.revealed[i]:
+                i = int(rng.random() * size)
+            start = time.perf_counter()
+            session.reveal(i % width, i // width)
+            times.append(time.perf_counter() - start)
+    return statistics.median(times) if times else 0.0
+
+def bench_win_check(width, height, seed, repeat):
+    """
+    Times checking whether a game in progress has been won.
+    """
+    session = GameSession(width, height, max(1, int(width * height * DENSITY)), seed)
+    session.reveal(width // 2, height // 2)
+    check = session.board.all_safe_cells_opened
+    # A single check is too fast to time on its own.
+    return measure(lambda _: [check() for _ in range(CHECKS)], repeat) / CHECKS
+
+def frame_benchmark():
+    """
+    Returns a function that times building and drawing one frame of the
+    grid, or None after printing why frames cannot be timed.
+    """
+    try:
+        import pyglet
+    except ImportError:
+        print("pyglet is not available, skipping the frame benchmarks.")
+        return None
+    pyglet.options["headless"] = True
+    try:
+        import haravasto as h
+        h.lataa_kuvat("./spritet")
+        h.luo_ikkuna(1280, 800)
+    except Exception as error: # pylint: disable=broad-except
+        # For example no display and no headless rendering on this machine.
+        print("Cannot open a window, skipping the frame benchmarks: {!r}".format(error))
+        return None
+
+    def bench_frame(width, height, seed, repeat):
+        """
+        Times laying out the visible grid and drawing it, as after the camera
+        has moved.
+        """
+        session = GameSession(width, height, max(1, int(width * height * DENSITY)), seed)
+        session.reveal(width // 2, height // 2)
+        h.luo_ruudukko(width, height, session.board.cell_key)
+
+        def frame(_):
+            h.pyyda_asettelu()
+            h.tyhjaa_ikkuna()
+            h.piirra_ruudukko()
+
+        return measure(frame, repeat)
+
+    return bench_frame
+
+def run(sizes, seed, repeat, frames=True):
+    """
+    Runs every benchmark on every board size.
+    Returns the results as a dictionary of benchmark names and seconds.
+    """
+    benchmarks = [
+        ("place_mines", bench_place_mines),
+        ("flood_fill", bench_flood_fill),
+        ("click", bench_click),
+        ("win_check", bench_win_check),
+    ]
+    bench_frame = frame_benchmark() if frames else None
+    if bench_frame is not None:
+        benchmarks.append(("frame", bench_frame))
+    results = {}
+    for width, height in sizes:
+        # Large boards are slow to set up, so they are timed fewer times.
+        times = max(3, repeat * 10000 // max(width * height, 10000))
+        for name, benchmark in benchmarks:
+            key = "{}/{}x{}".format(name, width, height)
+            results[key] = benchmark(width, height, seed, times)
+            print("{:<24} {:>14.2f} us".format(key, results[key] * 1000000))
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Prints how the results changed from an earlier run.
+    Returns the names of the benchmarks that got slower than the threshold.
+    """
+    regressions = []
+    for key, seconds in results.items():
+        before = baseline.get(key)
+        if not before:
+            continue
+        change = seconds / before - 1
+        marker = ""
+        if change > threshold:
+            regressions.append(key)
+            marker = "  REGRESSION"
+        print("{:<24} {:>+8.1%}{}".format(key, change, marker))
+    return regressions
+
+def parse_size(text):
+    """
+    Returns a board size given as WIDTHxHEIGHT.
+    """
+    try:
+        width, height = (int(value) for value in text.lower().split("x"))
+    except ValueError as error:
+        raise argparse.ArgumentTypeError("board size must look like 30x16") from error
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError("board size must be positive")
+    return width, height
+
+def main(arguments=None):
+    """
+    Runs the benchmarks from the command line.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the minesweeper engine.")
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=SIZES,
+                        help="board sizes as WIDTHxHEIGHT")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the boards")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs on small boards")
+    parser.add_argument("--no-frames", action="store_true", help="skip the frame benchmarks")
+    parser.add_argument("--save", default=None, help="JSON file to save the results to")
+    parser.add_argument("--compare", default=None, help="JSON file of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown against the earlier run, 0.25 is 25%%")
+    options = parser.parse_args(arguments)
+
+    results = run(options.sizes, options.seed, options.repeat, not options.no_frames)
+    if options.save:
+        with open(options.save, "w", encoding='utf-8') as target:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "seed": options.seed,
+                "results": results
+            }, target, indent=2)
+    if options.compare:
+        with open(options.compare, "r", encoding='utf-8') as source:
+            baseline = json.load(source)["results"]
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print("{} benchmarks got slower by more than {:.0%}.".format(
+                len(regressions), options.threshold))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""
+Game board for the minesweeper game.
+
+The board is stored as flat byte planes with one byte per cell,
+so cell (x, y) is found at index y * width + x in every plane.
+"""
+from collections import deque
+import math
+import random as rnd
+import re
+
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1))
+EMPTY_RUN = re.compile(b"\x00*") # Run of cells without neighboring mines
+NUMPY_BATCH = 2 ** 20 # Cells of boards generated at once with NumPy
+
+class Board:
+    """
+    Holds the mines, opened cells and flags of a single game.
+    """
+    __slots__ = ("width", "height", "mine_amount", "safe_cells_left", "seed", "placed",
+                 "mines", "revealed", "flagged", "counts")
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.mine_amount = 0
+        self.seed = None
+        self.placed = False
+        self.safe_cells_left = width * height # Unopened cells without a mine
+        self.mines = bytearray(width * height)
+        self.revealed = bytearray(width * height)
+        self.flagged = bytearray(width * height)
+        self.counts = bytearray(width * height)
+
+    def index(self, x, y):
+        """
+        Returns the flat plane index of a cell.
+        """
+        return y * self.width + x
+
+    def in_bounds(self, x, y):
+        """
+        Returns True if the cell is inside the board.
+        """
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def neighbors(self, x, y):
+        """
+        Returns the coordinates of all cells next to a given cell.
+        """
+        cells = []
+        for dir_x, dir_y in DIRECTIONS:
+            cell_x, cell_y = x + dir_x, y + dir_y
+            if 0 <= cell_x < self.width and 0 <= cell_y < self.height:
+                cells.append((cell_x, cell_y))
+        return cells
+
+    def place_mines(self, mine_amount, seed=None, first_click=None):
+        """
+        Randomly places N mines on the board. The same seed always gives the
+        same board, and the seed used is saved so that the board can be made
+        again. If the first clicked cell is given, it and its neighbors are
+        kept free of mines whenever the board has room for it.
+        """
+        if seed is None:
+            seed = rnd.randrange(2 ** 32)
+        size = len(self.mines)
+        excluded = []
+        if first_click is not None:
+            x, y = first_click
+            excluded = [(x, y)] + self.neighbors(x, y)
+            if size - len(excluded) < mine_amount:
+                excluded = excluded[:1] if size > mine_amount else []
+        excluded = [self.index(x, y) for x, y in excluded]
+        free = size - len(excluded)
+        # Only the smaller group is picked: mines on sparse boards
+        # and safe cells on dense boards.
+        if mine_amount * 2 <= free:
+            self._pick_cells(rnd.Random(seed), excluded, mine_amount, 1)
+        else:
+            self._pick_cells(rnd.Random(seed), excluded, free - mine_amount, 0)
+        self.seed = seed
+        self.mine_amount = mine_amount
+        self.safe_cells_left = size - mine_amount
+        self.placed = True
+        self.update_counts()
+
+    def _pick_cells(self, rng, excluded, amount, value):
+        """
+        Sets the value of N random cells in the mine plane and the opposite
+        value to the rest of the cells. Excluded cells never get a mine.
+        """
+        mines, size = self.mines, len(self.mines)
+        free = size - len(excluded)
+        other = 1 - value
+        if amount * 16 <= free:
+            # Few cells: pick them one by one in time proportional to N.
+            mines[:] = bytes((other,)) * size
+            for i in excluded:
+                mines[i] = 2
+            picked = 0
+        else:
+            # Many cells: give every cell the value with the right probability
+            # in one pass, then fix the amount one cell at a time.
+            threshold = round(amount / free * 256)
+            table = bytes(value if byte < threshold else other for byte in range(256))
+            mines[:] = rng.randbytes(size).translate(table)
+            for i in excluded:
+                mines[i] = 2
+            picked = mines.count(value)
+            while picked > amount:
+                i = int(rng.random() * size)
+                if mines[i] == value:
+                    mines[i] = other
+                    picked -= 1
+        while picked < amount:
+            i = int(rng.random() * size)
+            if mines[i] == other:
+                mines[i] = value
+                picked += 1
+        for i in excluded:
+            mines[i] = 0
+
+    def update_counts(self):
+        """
+        Computes the neighboring mine amount of every cell at once.
+        """
+        self.counts[:] = neighbor_counts(self.mines, self.width, self.height)
+
+    def set_mines(self, mines, counts=None, seed=None):
+        """
+        Uses a ready mine plane, for example one made by generate_boards,
+        instead of placing the mines randomly.
+        """
+        self.mines[:] = mines
+        self.seed = seed
+        self.mine_amount = self.mines.count(1)
+        self.safe_cells_left = len(self.mines) - self.mine_amount
+        self.placed = True
+        if counts is None:
+            self.update_counts()
+        else:
+            self.counts[:] = counts
+
+    def is_mine(self, x, y):
+        """
+        Returns True if the cell contains a mine.
+        """
+        return self.mines[y * self.width + x] == 1
+
+    def is_revealed(self, x, y):
+        """
+        Returns True if the cell has been opened.
+        """
+        return self.revealed[y * self.width + x] == 1
+
+    def is_flagged(self, x, y):
+        """
+        Returns True if the cell has a flag on it.
+        """
+        return self.flagged[y * self.width + x] == 1
+
+    def reveal(self, x, y):
+        """
+        Opens a single cell. Opening a cell removes a flag from it.
+        """
+        i = y * self.width + x
+        if not self.revealed[i] and not self.mines[i]:
+            self.safe_cells_left -= 1
+        self.revealed[i] = 1
+        self.flagged[i] = 0
+
+    def flood_fill(self, x, y):
+        """
+        Opens a cell, and if it has no neighboring mines, every connected
+        empty cell and the numbered cells around them.
+        Returns the cells that were opened by this call as a list of
+        (start, end) spans of flat indexes, the end not included.
+        """
+        width, size = self.width, len(self.mines)
+        mines, revealed, flagged, counts = self.mines, self.revealed, self.flagged, self.counts
+        start = y * width + x
+        if revealed[start]:
+            return []
+        revealed[start] = 1
+        flagged[start] = 0
+        if mines[start]:
+            return [(start, start + 1)]
+        if counts[start] != 0:
+            self.safe_cells_left -= 1
+            return [(start, start + 1)]
+        # Empty cells are opened one row span at a time. The revealed plane
+        # doubles as the visited bitmap: cells are marked when they are
+        # queued, so every cell is handled only once.
+        opened = [(start, start + 1)]
+        squares = deque((start,))
+        empty_run = EMPTY_RUN.match
+        while squares:
+            i = squares.popleft()
+            row_start = i - i % width
+            row_end = row_start + width
+            # The span ends on the left at the nearest number or opened cell,
+            # which is most often the cell right next to it.
+            if i == row_start or revealed[i - 1] or counts[i - 1]:
+                left = i
+            else:
+                left = max(revealed.rfind(1, row_start, i),
+                           *(counts.rfind(count, row_start, i) for count in range(1, 9))) + 1
+                left = max(left, row_start)
+            right = empty_run(counts, i + 1, row_end).end()
+            blocked = revealed.find(1, i + 1, right)
+            if blocked != -1:
+                right = blocked
+            for low, high in ((left, i), (i + 1, right)):
+                if low < high:
+                    revealed[low:high] = b"\x01" * (high - low)
+                    flagged[low:high] = bytes(high - low)
+                    opened.append((low, high))
+            # Open the cells around the span on its own row and the rows next
+            # to it. Only the first cell of each empty run is queued, the span
+            # search above opens the rest of the run.
+            low = max(left - 1, row_start)
+            high = min(right + 1, row_end)
+            for offset in (-width, 0, width):
+                if 0 <= row_start + offset < size:
+                    end = high + offset
+                    j = revealed.find(0, low + offset, end)
+                    while j != -1:
+                        revealed[j] = 1
+                        flagged[j] = 0
+                        # Numbers next to each other on a row share a span.
+                        if opened[-1][1] == j:
+                            opened[-1] = (opened[-1][0], j + 1)
+                        else:
+                            opened.append((j, j + 1))
+                        if counts[j] == 0:
+                            squares.append(j)
+                            j = empty_run(counts, j, end).end()
+                        else:
+                            j += 1
+                        j = revealed.find(0, j, end)
+        # Cells next to empty cells never have mines, so all of them were safe.
+        self.safe_cells_left -= sum(end - start for start, end in opened)
+        return opened
+
+    def toggle_flag(self, x, y):
+        """
+        Places or removes a flag on an unopened cell.
+        """
+        i = y * self.width + x
+        if not self.revealed[i]:
+            self.flagged[i] ^= 1
+
+    def count(self, x, y):
+        """
+        Returns the amount of mines next to a cell.
+        """
+        return self.counts[y * self.width + x]
+
+    def all_safe_cells_opened(self):
+        """
+        Returns True if every cell without a mine has been opened.
+        """
+        return self.safe_cells_left == 0
+
+    def cell_key(self, x, y):
+        """
+        Returns the graphics key of a cell as seen by the player:
+        " " for unopened, "f" for flags, "x" for mines and "0"-"8" for opened cells.
+        """
+        i = y * self.width + x
+        if self.revealed[i]:
+            if self.mines[i]:
+                return "x"
+            return str(self.counts[i])
+        if self.flagged[i]:
+            return "f"
+        return " "
+
+def plane_spans(plane):
+    """
+    Returns the runs of cells set to 1 in a plane as (start, end) spans of
+    flat indexes, the same form flood_fill returns opened cells in.
+    """
+    spans = []
+    start = plane.find(1)
+    while start != -1:
+        end = plane.find(0, start)
+        if end == -1:
+            end = len(plane)
+        spans.append((start, end))
+        start = plane.find(1, end)
+    return spans
+
+def neighbor_counts(mines, width, height, boards=1):
+    """
+    Returns the neighboring mine amount of every cell of one or more boards
+    stacked one after another in a mine plane.
+
+    The mine plane is read as one big integer with one byte per cell, so
+    shifting it by 8 bits moves every cell one step sideways and by
+    8 * width bits one row up or down. A cell has at most 8 neighbors,
+    so the byte sums never carry over to the next cell.
+    """
+    size = width * height
+    if size == 0 or boards == 0:
+        return bytes(0)
+    plane = int.from_bytes(mines, "little")
+    # Masks that keep mines from wrapping to the other edge of the next row
+    # or to the next board. Shifting a mask moves its gaps from the first
+    # column or row to the last, which is cheaper than reading another one.
+    not_first = int.from_bytes((b"\x00" + b"\x01" * (width - 1)) * (height * boards), "little")
+    not_last = not_first >> 8
+    not_top = int.from_bytes((bytes(width) + b"\xff" * (size - width)) * boards, "little")
+    not_bottom = not_top >> (8 * width)
+    row = plane + ((plane & not_last) << 8) + ((plane & not_first) >> 8)
+    total = row + ((row << (8 * width)) & not_top) + ((row >> (8 * width)) & not_bottom) - plane
+    return total.to_bytes(size * boards, "little")
+
+def generate_boards(width, height, mine_amount, amount, seed=None):
+    """
+    Generates the mines and neighbor counts of many boards of the same size
+    at once, the same seed always giving the same boards. Returns a mine
+    plane and a count plane with the boards stacked one after another, so
+    board n is found at [n * width * height:(n + 1) * width * height].
+
+    The planes can be viewed as a 3D array without copying, for example with
+    memoryview(mines).cast("B", (amount, height, width)) or numpy.frombuffer,
+    and a single board can be played with Board.set_mines.
+
+    The boards are made with NumPy when it is installed and with the bytearray
+    version below when it is not. The two use different random numbers, so
+    the same seed gives different boards depending on which one ran.
+    """
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        return _generate_numpy(numpy, width, height, mine_amount, amount, seed)
+    size = width * height
+    rng = rnd.Random(seed)
+    # As in Board.place_mines, only the smaller group of cells is picked.
+    if mine_amount * 2 <= size:
+        value, picks = 1, mine_amount
+    else:
+        value, picks = 0, size - mine_amount
+    other = 1 - value
+    # Every cell of every board gets the value with about the right
+    # probability in one pass, then each board is fixed to the exact amount.
+    # The probability is aimed half a standard deviation low: a missing cell
+    # is added by hitting the larger group, which takes fewer tries than
+    # hitting the smaller group to remove an extra one. The boards stay
+    # uniformly random either way.
+    deviation = math.sqrt(picks * (size - picks) / size) if size else 0.0
+    threshold = round(max(picks - deviation / 2, 0) / size * 256) if size else 0
+    table = bytes(value if byte < threshold else other for byte in range(256))
+    mines = bytearray(rng.randbytes(size * amount).translate(table))
+    random = rng.random
+    for start in range(0, size * amount, size):
+        picked = mines.count(value, start, start + size)
+        while picked > picks:
+            i = start + int(random() * size)
+            if mines[i] == value:
+                mines[i] = other
+                picked -= 1
+        while picked < picks:
+            i = start + int(random() * size)
+            if mines[i] == other:
+                mines[i] = value
+                picked += 1
+    return mines, bytearray(neighbor_counts(mines, width, height, amount))
+
+def _generate_numpy(numpy, width, height, mine_amount, amount, seed):
+    """
+    Generates boards as generate_boards does, with NumPy. The seed can also
+    be a numpy.random.SeedSequence. The boards are made in batches of about
+    NUMPY_BATCH cells, which keeps the arrays used on the way small.
+
+    The cells are picked with Floyd's algorithm: the k-th pick is a random
+    cell among the first size - picks + k cells, or the last of them if that
+    one was taken already, which gives every set of cells the same chance.
+    Each step is done for all boards of a batch at once. A batch of only a
+    few large boards picks the cells of each board on its own instead.
+    """
+    size = width * height
+    rng = numpy.random.default_rng(seed)
+    mine_amount = max(min(mine_amount, size), 0)
+    # As in Board.place_mines, only the smaller group of cells is picked.
+    if mine_amount * 2 <= size:
+        value, picks = 1, mine_amount
+    else:
+        value, picks = 0, size - mine_amount
+    mine_plane, count_plane = bytearray(size * amount), bytearray(size * amount)
+    # Views of the planes, so the arrays are written straight into them.
+    mines = numpy.frombuffer(mine_plane, dtype=numpy.uint8).reshape(amount, height, width)
+    counts = numpy.frombuffer(count_plane, dtype=numpy.uint8).reshape(amount, height, width)
+    batch = max(NUMPY_BATCH // size, 1) if size else amount
+    for start in range(0, amount, batch):
+        end = min(start + batch, amount)
+        picked = mines[start:end].reshape(-1)
+        if picks > end - start:
+            for board in picked.reshape(end - start, size):
+                board[rng.choice(size, picks, replace=False)] = 1
+        elif picks:
+            offsets = numpy.arange(0, (end - start) * size, size)
+            limits = numpy.arange(size - picks + 1, size + 1)
+            cells = (rng.random((picks, end - start)) * limits[:, None]).astype(numpy.int64)
+            cells += offsets
+            for step, cell in enumerate(cells):
+                numpy.copyto(cell, offsets + size - picks + step, where=picked[cell].view(bool))
+                picked[cell] = 1
+        if not value:
+            picked ^= 1
+        # Each board with a border of empty cells. Sums of three cells
+        # sideways and then three rows give the counts plus the cell itself.
+        padded = numpy.zeros((end - start, height + 2, width + 2), dtype=numpy.uint8)
+        padded[:, 1:-1, 1:-1] = mines[start:end]
+        rows = padded[:, :, :-2] + padded[:, :, 1:-1] + padded[:, :, 2:]
+        counts[start:end] = rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:] - mines[start:end]
+    return mine_plane, count_plane
@@ -0,0 +1,291 @@
+"""
+Chunked game board for maps too large to keep in memory.
+
+The board is split into square chunks. The mines of a chunk are generated
+from a hash of the seed and the chunk coordinates when something first
+looks at the chunk, so any chunk can be made again at any time. Generated
+mines and neighbor counts are kept in a cache that drops the least recently
+used chunks, while opened cells and flags are kept for every chunk the
+player has touched. Memory use therefore follows the explored area instead
+of the size of the map.
+"""
+from collections import OrderedDict, deque
+import hashlib
+import random as rnd
+from board import DIRECTIONS, neighbor_counts
+
+CHUNK = 64 # Width and height of a chunk in cells
+CACHE_SIZE = 1024 # Chunks of generated mines and counts kept in memory
+# Below this share of mines, empty areas of a large map grow without end
+# and a single flood fill could open most of the map.
+MIN_DENSITY = 0.15
+EMPTY_CHUNK = bytes(CHUNK * CHUNK)
+
+def chunk_seed(seed, chunk_x, chunk_y):
+    """
+    Returns the random seed of a chunk, hashed from the board seed and the
+    chunk coordinates.
+    """
+    key = "{}:{}:{}".format(seed, chunk_x, chunk_y).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+class ChunkedBoard:
+    """
+    Holds the mines, opened cells and flags of a single game in chunks that
+    are created when needed. Offers the same methods as Board, apart from
+    the flat planes.
+    """
+    __slots__ = ("width", "height", "mine_amount", "safe_cells_left", "seed", "placed",
+                 "density", "excluded", "first_click", "cache", "cache_size", "revealed",
+                 "flagged")
+
+    def __init__(self, width, height, cache_size=CACHE_SIZE):
+        self.width = width
+        self.height = height
+        self.mine_amount = 0
+        self.seed = None
+        self.placed = False
+        self.safe_cells_left = width * height # Unopened cells without a mine
+        self.density = 0.0
+        self.excluded = frozenset() # Cells kept free of mines around the first click
+        self.first_click = None # Needed to place the same mines again
+        self.cache = OrderedDict() # Chunk -> [mines, counts or None]
+        self.cache_size = cache_size
+        self.revealed = {} # Chunk -> opened cells of a touched chunk
+        self.flagged = {} # Chunk -> flags of a touched chunk
+
+    def in_bounds(self, x, y):
+        """
+        Returns True if the cell is inside the board.
+        """
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def neighbors(self, x, y):
+        """
+        Returns the coordinates of all cells next to a given cell.
+        """
+        cells = []
+        for dir_x, dir_y in DIRECTIONS:
+            cell_x, cell_y = x + dir_x, y + dir_y
+            if 0 <= cell_x < self.width and 0 <= cell_y < self.height:
+                cells.append((cell_x, cell_y))
+        return cells
+
+    def place_mines(self, mine_amount, seed=None, first_click=None):
+        """
+        Sets the share of mines and the seed the chunks are generated from.
+        No chunk is generated yet. The first clicked cell and its neighbors
+        are kept free of mines.
+        """
+        size = self.width * self.height
+        if mine_amount < size * MIN_DENSITY:
+            raise ValueError("chunked boards need at least {:.0%} mines".format(MIN_DENSITY))
+        if seed is None:
+            seed = rnd.randrange(2 ** 32)
+        self.seed = seed
+        self.density = mine_amount / size
+        self.first_click = first_click
+        if first_click is not None:
+            x, y = first_click
+            self.excluded = frozenset([(x, y)] + self.neighbors(x, y))
+        self.cache.clear()
+        self.mine_amount = self._total_mines()
+        self.safe_cells_left = size - self.mine_amount
+        self.placed = True
+
+    def _chunk_mines(self, chunk_x, chunk_y):
+        """
+        Returns the cells of a chunk that may have mines and the amount of
+        mines in the chunk.
+        """
+        x_0, y_0 = chunk_x * CHUNK, chunk_y * CHUNK
+        width = min(CHUNK, self.width - x_0)
+        height = min(CHUNK, self.height - y_0)
+        if width == height == CHUNK:
+            cells = range(CHUNK * CHUNK)
+        else:
+            cells = [y * CHUNK + x for y in range(height) for x in range(width)]
+        if any(x_0 <= x < x_0 + CHUNK and y_0 <= y < y_0 + CHUNK for x, y in self.excluded):
+            cells = [i for i in cells if (x_0 + i % CHUNK, y_0 + i // CHUNK) not in self.excluded]
+        return cells, min(round(self.density * width * height), len(cells))
+
+    def _total_mines(self):
+        """
+        Returns the amount of mines on the whole board without generating it.
+        All full chunks have the same amount of mines, so only the chunks on
+        the right and bottom edges and around the first click differ.
+        """
+        full_x, rest_x = divmod(self.width, CHUNK)
+        full_y, rest_y = divmod(self.height, CHUNK)
+        total = 0
+        for columns, width in ((full_x, CHUNK), (1 if rest_x else 0, rest_x)):
+            for rows, height in ((full_y, CHUNK), (1 if rest_y else 0, rest_y)):
+                total += columns * rows * round(self.density * width * height)
+        for chunk in {(x // CHUNK, y // CHUNK) for x, y in self.excluded}:
+            x_0, y_0 = chunk[0] * CHUNK, chunk[1] * CHUNK
+            nominal = round(self.density * min(CHUNK, self.width - x_0)
+                            * min(CHUNK, self.height - y_0))
+            total -= nominal - self._chunk_mines(*chunk)[1]
+        return total
+
+    def _entry(self, chunk):
+        """
+        Returns the cache entry of a chunk, generating its mines if needed.
+        """
+        entry = self.cache.get(chunk)
+        if entry is not None:
+            self.cache.move_to_end(chunk)
+            return entry
+        mines = self._generate(chunk) if self.placed else bytearray(CHUNK * CHUNK)
+        entry = self.cache[chunk] = [mines, None]
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return entry
+
+    def _generate(self, chunk):
+        """
+        Returns the mine plane of a chunk generated from its seed.
+        """
+        mines = bytearray(CHUNK * CHUNK)
+        cells, amount = self._chunk_mines(*chunk)
+        for i in rnd.Random(chunk_seed(self.seed, *chunk)).sample(cells, amount):
+            mines[i] = 1
+        return mines
+
+    def _mines(self, chunk):
+        """
+        Returns the mine plane of a chunk, empty outside the board.
+        """
+        chunk_x, chunk_y = chunk
+        if (chunk_x < 0 or chunk_y < 0
+            or chunk_x * CHUNK >= self.width or chunk_y * CHUNK >= self.height):
+            return EMPTY_CHUNK
+        return self._entry(chunk)[0]
+
+    def _counts(self, chunk):
+        """
+        Returns the neighbor count plane of a chunk. The counts of the edge
+        cells come from the mines of the chunks around it.
+        """
+        entry = self._entry(chunk)
+        if entry[1] is None:
+            chunk_x, chunk_y = chunk
+            around = {
+                (dx, dy): self._mines((chunk_x + dx, chunk_y + dy))
+                for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+            }
+            # The chunk with a one cell border from the chunks around it.
+            padded = bytearray()
+            for dy, rows in ((-1, (CHUNK - 1,)), (0, range(CHUNK)), (1, (0,))):
+                left, middle, right = around[-1, dy], around[0, dy], around[1, dy]
+                for row in rows:
+                    start = row * CHUNK
+                    padded.append(left[start + CHUNK - 1])
+                    padded += middle[start:start + CHUNK]
+                    padded.append(right[start])
+            counts = neighbor_counts(padded, CHUNK + 2, CHUNK + 2)
+            entry[1] = b"".join(
+                counts[row * (CHUNK + 2) + 1:row * (CHUNK + 2) + 1 + CHUNK]
+                for row in range(1, CHUNK + 1)
+            )
+        return entry[1]
+
+    def is_mine(self, x, y):
+        """
+        Returns True if the cell contains a mine.
+        """
+        return self._mines((x // CHUNK, y // CHUNK))[y % CHUNK * CHUNK + x % CHUNK] == 1
+
+    def is_revealed(self, x, y):
+        """
+        Returns True if the cell has been opened.
+        """
+        plane = self.revealed.get((x // CHUNK, y // CHUNK))
+        return plane is not None and plane[y % CHUNK * CHUNK + x % CHUNK] == 1
+
+    def is_flagged(self, x, y):
+        """
+        Returns True if the cell has a flag on it.
+        """
+        plane = self.flagged.get((x // CHUNK, y // CHUNK))
+        return plane is not None and plane[y % CHUNK * CHUNK + x % CHUNK] == 1
+
+    def _set(self, planes, x, y, value):
+        """
+        Sets a cell of the opened cells or flags, creating the plane of its
+        chunk when needed.
+        """
+        chunk = (x // CHUNK, y // CHUNK)
+        plane = planes.get(chunk)
+        if plane is None:
+            if not value:
+                return
+            plane = planes[chunk] = bytearray(CHUNK * CHUNK)
+        plane[y % CHUNK * CHUNK + x % CHUNK] = value
+
+    def reveal(self, x, y):
+        """
+        Opens a single cell. Opening a cell removes a flag from it.
+        """
+        if not self.is_revealed(x, y) and not self.is_mine(x, y):
+            self.safe_cells_left -= 1
+        self._set(self.revealed, x, y, 1)
+        self._set(self.flagged, x, y, 0)
+
+    def flood_fill(self, x, y):
+        """
+        Opens a cell, and if it has no neighboring mines, every connected
+        empty cell and the numbered cells around them, across chunk borders.
+        Returns the cells that were opened by this call as a list of
+        (start, end) spans of flat indexes, as Board.flood_fill does.
+        """
+        if self.is_revealed(x, y):
+            return []
+        self.reveal(x, y)
+        opened = [y * self.width + x]
+        if self.is_mine(x, y):
+            return [(opened[0], opened[0] + 1)]
+        squares = deque(((x, y),))
+        while squares:
+            x, y = squares.popleft()
+            if self.count(x, y) != 0:
+                continue
+            for cell_x, cell_y in self.neighbors(x, y):
+                if not self.is_revealed(cell_x, cell_y):
+                    # Cells next to empty cells never have mines.
+                    self.reveal(cell_x, cell_y)
+                    opened.append(cell_y * self.width + cell_x)
+                    squares.append((cell_x, cell_y))
+        return [(i, i + 1) for i in opened]
+
+    def toggle_flag(self, x, y):
+        """
+        Places or removes a flag on an unopened cell.
+        """
+        if not self.is_revealed(x, y):
+            self._set(self.flagged, x, y, 0 if self.is_flagged(x, y) else 1)
+
+    def count(self, x, y):
+        """
+        Returns the amount of mines next to a cell.
+        """
+        return self._counts((x // CHUNK, y // CHUNK))[y % CHUNK * CHUNK + x % CHUNK]
+
+    def all_safe_cells_opened(self):
+        """
+        Returns True if every cell without a mine has been opened.
+        """
+        return self.safe_cells_left == 0
+
+    def cell_key(self, x, y):
+        """
+        Returns the graphics key of a cell as seen by the player:
+        " " for unopened, "f" for flags, "x" for mines and "0"-"8" for opened cells.
+        """
+        if self.is_revealed(x, y):
+            if self.is_mine(x, y):
+                return "x"
+            return str(self.count(x, y))
+        if self.is_flagged(x, y):
+            return "f"
+        return " "
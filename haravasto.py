@@ -27,8 +27,14 @@ if muokkaus & haravasto.MOD_SHIFT:
     # jotaintapahtuu
 """
 
+import math
+import time
+
 import pyglet
-from pyglet.gl import glEnable, GL_TEXTURE_2D
+from pyglet.gl import (
+    glBindTexture, glEnable, glTexParameteri,
+    GL_NEAREST, GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_TEXTURE_MIN_FILTER
+)
 
 HIIRI_VASEN = pyglet.window.mouse.LEFT
 HIIRI_KESKI = pyglet.window.mouse.MIDDLE
@@ -48,14 +54,53 @@ grafiikka = {
     "taustavari": None,
     "puskuri": None,
     "spritet": [],
-    "kuvat": {}
+    "kuvat": {},
+    "ruudukko": None,
+    "pienoiskartta": None,
 }
 
+# Kerran ladatut kuvat kansion mukaan, jotta niitä ei tarvitse ladata
+# uudestaan kun ikkuna avataan uudestaan.
+kuvavarasto = {}
+
 kasittelijat = {
     "toistuvat": [],
+    "hiiri": None,
+}
+
+# Piirtotilan asetukset. Tapahtumapohjaisessa tilassa ikkuna piirretään vain
+# syötteiden jälkeen ja kun ohjelma sitä erikseen pyytää.
+piirto = {
+    "tapahtumapohjainen": False,
+    "valiaika": 1 / 60,
+    "pyydetty": False,
+    "edellinen": 0.0,
+}
+
+# Ruudukon kamera. Koordinaatit kertovat, mikä ruudukon piste näkyy ikkunan
+# vasemmassa alakulmassa, kun ruudun koko on zoomaamaton.
+kamera = {
+    "kaytossa": False,
+    "x": 0.0,
+    "y": 0.0,
+    "zoom": 1.0,
+    "sovita": True,
+    "painallus": None,
+    "raahattu": False,
 }
 
-glEnable(GL_TEXTURE_2D)
+PYGLET_2 = int(pyglet.version.split(".")[0]) >= 2
+PIENIN_ZOOM = 0.25
+SUURIN_ZOOM = 4.0
+PIENIN_SOVITUS = 0.5 # Pienin zoom, jolla ruudukko sovitetaan ikkunaan itsestään
+VALKOINEN = (255, 255, 255) # Sävy, jolla ruudun kuva näkyy sellaisenaan
+RAAHAUSRAJA = 5 # Kuinka monta pikseliä hiiren pitää liikkua, jotta se on raahausta
+PIENOISKARTAN_REUNUS = 10 # Pienoiskartan etäisyys ikkunan reunoista pikseleinä
+
+# Pyglet 2 piirtää varjostimilla, joissa tekstuurit ovat aina käytössä, eikä
+# sen OpenGL-versio tunne tätä asetusta lainkaan.
+if not PYGLET_2:
+    glEnable(GL_TEXTURE_2D)
 
 def lataa_kuvat(polku):
     """
@@ -64,11 +109,13 @@ def lataa_kuvat(polku):
     mukaan. Jos haluat lisätä omaa grafiikkaa, voit ottaa mallia sen
     lataamiseksi tästä funktiosta.
 
-    Funktio käyttää Pygletin resource-moduulia, joka lataa kuvat älykkäästi.
-    Viittaukset yksittäisiin kuviin talletetaan sanakirjaan, jotta niihin on
-    helppo viitata myöhemmin. Sanakirjan avaimissa numerot 0-8 merkkijonoina
-    kuvaavat avattuja ruutuja, x miinoja, f lippuja ja välilyönti avaamatonta
-    ruutua.
+    Funktio käyttää Pygletin resource-moduulia tiedostojen löytämiseen, ja
+    pakkaa kaikki kuvat yhteen tekstuuriin (atlakseen), jotta koko ruudukko
+    voidaan piirtää vaihtamatta tekstuuria välillä. Kerran ladatusta kansiosta
+    ei ladata kuvia uudestaan. Viittaukset yksittäisiin kuviin talletetaan
+    sanakirjaan, jotta niihin on helppo viitata myöhemmin. Sanakirjan
+    avaimissa numerot 0-8 merkkijonoina kuvaavat avattuja ruutuja, x miinoja,
+    f lippuja ja välilyönti avaamatonta ruutua.
 
     Oletusgrafiikassa yhden ruudun koko on 40x40 pikseliä.
 
@@ -78,15 +125,53 @@ def lataa_kuvat(polku):
     :param str polku: sijainti josta kuvat ladataan
     """
 
-    pyglet.resource.path = [polku]
+    if polku not in kuvavarasto:
+        pyglet.resource.path = [polku]
+        pyglet.resource.reindex()
+        tiedostot = {}
+        tiedostot["0"] = "ruutu_tyhja.png"
+        for i in range(1, 9):
+            tiedostot[str(i)] = "ruutu_{}.png".format(i)
+        tiedostot["x"] = "ruutu_miina.png"
+        tiedostot[" "] = "ruutu_selka.png"
+        tiedostot["f"] = "ruutu_lippu.png"
+        kuvavarasto[polku] = _lataa_atlakseen(tiedostot)
+    grafiikka["kuvat"].update(kuvavarasto[polku])
+
+def _lataa_atlakseen(tiedostot):
+    """
+    Lataa kuvat ja pakkaa ne yhteen tekstuuriatlakseen. Palauttaa sanakirjan,
+    jossa jokaista avainta vastaa kuvan alue atlaksessa.
+
+    :param dict tiedostot: sanakirja, jonka arvot ovat kuvatiedostojen nimiä
+    :return: sanakirja, jonka arvot ovat atlaksen alueita
+    """
+
     kuvat = {}
-    kuvat["0"] = pyglet.resource.image("ruutu_tyhja.png")
-    for i in range(1, 9):
-        kuvat[str(i)] = pyglet.resource.image("ruutu_{}.png".format(i))
-    kuvat["x"] = pyglet.resource.image("ruutu_miina.png")
-    kuvat[" "] = pyglet.resource.image("ruutu_selka.png")
-    kuvat["f"] = pyglet.resource.image("ruutu_lippu.png")
-    grafiikka["kuvat"].update(kuvat)
+    for avain, nimi in tiedostot.items():
+        with pyglet.resource.file(nimi) as tiedosto:
+            kuvat[avain] = pyglet.image.load(nimi, file=tiedosto)
+    # Kuvien väliin jätetään yhden pikselin reunus, jotta zoomattuun ruutuun
+    # ei tule pikseleitä atlaksen viereisestä kuvasta.
+    sivu = max(max(kuva.width, kuva.height) for kuva in kuvat.values()) + 2
+    sarakkeet = math.ceil(math.sqrt(len(kuvat)))
+    # Tekstuurin sivun pituus on kahden potenssi, johon kaikki kuvat mahtuvat.
+    koko = 1
+    while koko < sarakkeet * sivu:
+        koko *= 2
+    atlas = pyglet.image.atlas.TextureAtlas(koko, koko)
+    _terava_tekstuuri(atlas.texture)
+    return {avain: atlas.add(kuva, border=1) for avain, kuva in kuvat.items()}
+
+def _terava_tekstuuri(tekstuuri):
+    """
+    Asettaa tekstuurin pikselit näkymään terävinä myös suurennettuina ja
+    pienennettyinä sen sijaan, että viereisten pikselien värit sekoitetaan.
+    """
+
+    glBindTexture(tekstuuri.target, tekstuuri.id)
+    glTexParameteri(tekstuuri.target, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    glTexParameteri(tekstuuri.target, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
 
 def lataa_sorsa(polku):
     """
@@ -122,11 +207,17 @@ def luo_ikkuna(leveys=800, korkeus=600, taustavari=(240, 240, 240, 255)):
     if grafiikka["ikkuna"] is None:
         grafiikka["ikkuna"] = pyglet.window.Window(leveys, korkeus, resizable=True)
         grafiikka["taustavari"] = taustavari
+        # Tausta on yksi pikseli, joka venytetään ikkunan kokoiseksi.
         grafiikka["tausta"] = pyglet.sprite.Sprite(
-            pyglet.image.SolidColorImagePattern(taustavari).create_image(leveys, korkeus)
+            pyglet.image.SolidColorImagePattern(taustavari).create_image(1, 1)
         )
+        grafiikka["tausta"].update(scale_x=leveys, scale_y=korkeus)
         grafiikka["ikkuna"].set_visible(False)
         grafiikka["ikkuna"].on_close = lopeta
+        grafiikka["ikkuna"].push_handlers(
+            on_expose=pyyda_piirto,
+            on_resize=_ikkunan_koko_muuttui
+        )
     else:
         muuta_ikkunan_koko(leveys, korkeus)
 
@@ -139,10 +230,7 @@ def muuta_ikkunan_koko(leveys, korkeus):
     """
 
     grafiikka["ikkuna"].set_size(leveys, korkeus)
-    grafiikka["tausta"] = pyglet.sprite.Sprite(
-        pyglet.image.SolidColorImagePattern(grafiikka["taustavari"]).create_image(leveys, korkeus)
-    )
-
+    _ikkunan_koko_muuttui(leveys, korkeus)
 
 def aseta_hiiri_kasittelija(kasittelija):
     """
@@ -170,10 +258,25 @@ def aseta_hiiri_kasittelija(kasittelija):
     """
 
     if grafiikka["ikkuna"]:
-        grafiikka["ikkuna"].on_mouse_press = kasittelija
+        kasittelijat["hiiri"] = kasittelija
+        grafiikka["ikkuna"].on_mouse_press = _piirra_jalkeen(_hiiri_painettu)
     else:
         print("Ikkunaa ei ole luotu!")
 
+def _hiiri_painettu(x, y, nappi, modit):
+    """
+    Kutsuu hiiren käsittelijää heti, tai kameran ollessa käytössä vasta kun
+    nappi vapautetaan.
+    """
+
+    if _pienoiskartan_klikkaus(x, y):
+        return
+    if kamera["kaytossa"]:
+        kamera["painallus"] = (x, y, nappi, modit)
+        kamera["raahattu"] = False
+    else:
+        kasittelijat["hiiri"](x, y, nappi, modit)
+
 def aseta_raahaus_kasittelija(kasittelija):
     """
     Asettaa funktion, jota käytetään kun hiiren kursoria raahataan napin
@@ -200,7 +303,7 @@ def aseta_raahaus_kasittelija(kasittelija):
     """
 
     if grafiikka["ikkuna"]:
-        grafiikka["ikkuna"].on_mouse_drag = kasittelija
+        grafiikka["ikkuna"].on_mouse_drag = _piirra_jalkeen(kasittelija)
     else:
         print("Ikkunaa ei ole luotu!")
 
@@ -224,7 +327,7 @@ def aseta_vapautus_kasittelija(kasittelija):
     """
 
     if grafiikka["ikkuna"]:
-        grafiikka["ikkuna"].on_mouse_release = kasittelija
+        grafiikka["ikkuna"].on_mouse_release = _piirra_jalkeen(kasittelija)
     else:
         print("Ikkunaa ei ole luotu!")
 
@@ -257,7 +360,7 @@ def aseta_nappain_kasittelija(kasittelija):
     """
 
     if grafiikka["ikkuna"]:
-        grafiikka["ikkuna"].on_key_press = kasittelija
+        grafiikka["ikkuna"].on_key_press = _piirra_jalkeen(kasittelija)
     else:
         print("Ikkunaa ei ole luotu!")
 
@@ -273,6 +376,7 @@ def aseta_piirto_kasittelija(kasittelija):
     aloita_ruutujen_piirto (kutsutaan ennen varsinaisen ruudukon piirtoa)
     lisaa_piirrettava_ruutu (lisää piirrettävän ruudun)
     piirra_ruudut (piirtää kaikki aloituksen jälkeen lisätyt ruudut)
+    piirra_ruudukko (piirtää luo_ruudukko-funktiolla luodun ruudukon)
 
     :param function kasittelija: käsittelijäfunktio piirtämiselle
     """
@@ -306,6 +410,90 @@ def aseta_toistuva_kasittelija(kasittelija, toistovali=1/60):
     pyglet.clock.schedule_interval(kasittelija, toistovali)
     kasittelijat["toistuvat"].append(kasittelija)
 
+def poista_toistuva_kasittelija(kasittelija):
+    """
+    Lopettaa aseta_toistuva_kasittelija-funktiolla asetetun funktion
+    periodiset kutsut. Funktiolla voi esim. pysäyttää animaation ilman että
+    ikkunaa tarvitsee sulkea.
+
+    :param function kasittelija: poistettava käsittelijäfunktio
+    """
+
+    pyglet.clock.unschedule(kasittelija)
+    while kasittelija in kasittelijat["toistuvat"]:
+        kasittelijat["toistuvat"].remove(kasittelija)
+
+def aseta_piirtotila(tapahtumapohjainen=True, maksimi_fps=60):
+    """
+    Valitsee, piirretäänkö ikkuna jatkuvasti vai vain tarvittaessa. Oletuksena
+    Pyglet piirtää ikkunan 60 kertaa sekunnissa, vaikka mikään ei olisi
+    muuttunut. Tapahtumapohjaisessa tilassa ikkuna piirretään vain hiiren ja
+    näppäimistön käsittelijöiden jälkeen, ikkunan koon muuttuessa sekä silloin
+    kun ohjelma kutsuu pyyda_piirto-funktiota. Tällöin ohjelma ei kuluta
+    prosessoriaikaa odottaessaan pelaajaa. Piirtojen tiheyttä rajoitetaan
+    annettuun ruudunpäivitysnopeuteen.
+
+    Funktiota tulee kutsua ennen aloita-funktiota.
+
+    :param bool tapahtumapohjainen: piirretäänkö vain tarvittaessa
+    :param int maksimi_fps: piirtokertojen enimmäismäärä sekunnissa
+    """
+
+    piirto["tapahtumapohjainen"] = tapahtumapohjainen
+    piirto["valiaika"] = 1 / maksimi_fps
+
+def pyyda_piirto(*_):
+    """
+    Pyytää ikkunan piirtämistä tapahtumapohjaisessa piirtotilassa. Kutsu tätä,
+    kun pelin tila muuttuu jonkin muun kuin syötteen takia (esim. ajastimen
+    käsittelijässä). Useat pyynnöt ennen seuraavaa piirtoa yhdistetään yhdeksi
+    piirroksi. Jatkuvassa piirtotilassa funktio ei tee mitään.
+    """
+
+    if piirto["tapahtumapohjainen"] and not piirto["pyydetty"]:
+        piirto["pyydetty"] = True
+        viive = piirto["edellinen"] + piirto["valiaika"] - time.perf_counter()
+        pyglet.clock.schedule_once(_piirra_ikkuna, max(viive, 0))
+
+def _piirra_ikkuna(_):
+    """
+    Piirtää ikkunan pyyda_piirto-funktion ajastamana.
+    """
+
+    piirto["pyydetty"] = False
+    piirto["edellinen"] = time.perf_counter()
+    ikkuna = grafiikka["ikkuna"]
+    if ikkuna is not None and ikkuna.visible:
+        ikkuna.switch_to()
+        ikkuna.dispatch_event("on_draw")
+        ikkuna.flip()
+
+def _ikkunan_koko_muuttui(leveys, korkeus):
+    """
+    Venyttää taustan ikkunan kokoiseksi, sovittaa ruudukon ikkunaan ja pyytää
+    ikkunan piirtämistä, kun ikkunan koko muuttuu.
+    """
+
+    grafiikka["tausta"].update(scale_x=leveys, scale_y=korkeus)
+    if grafiikka["ruudukko"] is not None:
+        if kamera["sovita"]:
+            sovita_ruudukko()
+        else:
+            siirra_kameraa(0, 0)
+    pyyda_piirto()
+
+def _piirra_jalkeen(kasittelija):
+    """
+    Palauttaa syötteen käsittelijän, joka pyytää ikkunan piirtämistä kun
+    annettu käsittelijä on suoritettu.
+    """
+
+    def kasittele(*argumentit):
+        tulos = kasittelija(*argumentit)
+        pyyda_piirto()
+        return tulos
+    return kasittele
+
 def aloita():
     """
     Käynnistää pelin. Ennen tämän kutsumista sinun tulee luoda ikkuna sekä
@@ -313,7 +501,13 @@ def aloita():
     """
 
     grafiikka["ikkuna"].set_visible(True)
-    pyglet.app.run()
+    if piirto["tapahtumapohjainen"]:
+        pyyda_piirto()
+        # Pyglet 1.x ei osaa jättää ikkunaa kokonaan piirtämättä, joten siinä
+        # ikkuna piirretään varmuuden vuoksi kerran sekunnissa.
+        pyglet.app.run(None if PYGLET_2 else 1.0)
+    else:
+        pyglet.app.run()
 
 def lopeta():
     """
@@ -325,6 +519,8 @@ def lopeta():
 
     for kasittelija in kasittelijat["toistuvat"]:
         pyglet.clock.unschedule(kasittelija)
+    pyglet.clock.unschedule(_piirra_ikkuna)
+    piirto["pyydetty"] = False
     pyglet.app.exit()
     grafiikka["ikkuna"].set_visible(False)
 
@@ -414,6 +610,599 @@ def piirra_ruudut():
     grafiikka["puskuri"].draw()
     grafiikka["spritet"].clear()
 
+def luo_ruudukko(leveys, korkeus, avainfunktio, koko=40):
+    """
+    Luo pysyvän ruudukon, joka piirretään yhdellä piirtopuskurilla. Toisin kuin
+    lisaa_piirrettava_ruutu-funktiota käytettäessä, ruudukkoa ei tarvitse
+    rakentaa uudestaan joka piirtokerralla, vaan siitä päivitetään
+    paivita_ruutu-funktiolla vain muuttuneet ruudut ja se piirretään
+    piirra_ruudukko-funktiolla.
+
+    Spritejä luodaan vain ikkunassa näkyville ruuduille, joten piirtämisen
+    hinta riippuu ikkunan koosta eikä ruudukon koosta. Siksi ruudukolle ei
+    anneta ruutujen avaimia vaan funktio, joka palauttaa ruudun avaimen
+    sarakkeen ja rivin perusteella, kun ruutu tulee näkyviin:
+
+    def avainfunktio(x, y):
+        return " "
+
+    Ruudukko sovitetaan ikkunaan: ruutujen koko lasketaan ikkunan ja ruudukon
+    koosta, ja se lasketaan uudestaan aina kun ikkunan koko muuttuu, kunnes
+    pelaaja zoomaa itse. Ruudukkoa ei skaalata siirtämällä spritejä, vaan
+    näytönohjain skaalaa koko piirtopuskurin kerralla. Jos ruudukko ei mahdu
+    ikkunaan, sen vasen alakulma on aluksi ikkunan vasemmassa alakulmassa, ja
+    kameran voi ottaa käyttöön ota_kamera_kayttoon-funktiolla. Uuden ruudukon
+    luominen korvaa edellisen.
+
+    :param int leveys: ruudukon leveys ruutuina
+    :param int korkeus: ruudukon korkeus ruutuina
+    :param function avainfunktio: funktio, joka palauttaa ruudun avaimen
+    :param int koko: yhden ruudun koko pikseleinä zoomaamattomana
+    """
+
+    grafiikka["ruudukko"] = {
+        "puskuri": pyglet.graphics.Batch(),
+        "spritet": [],
+        "avaimet": [],
+        "varit": [],
+        "savyt": {},
+        "leveys": leveys,
+        "korkeus": korkeus,
+        "koko": koko,
+        "avainfunktio": avainfunktio,
+        "alue": (0, 0, 0, 0),
+        "mitat": (0, 0),
+        "muuttunut": True,
+    }
+    kamera["x"] = 0.0
+    kamera["y"] = 0.0
+    kamera["zoom"] = 1.0
+    kamera["sovita"] = True
+    if grafiikka["ikkuna"] is not None:
+        sovita_ruudukko()
+
+def pyyda_asettelu():
+    """
+    Pyytää pysyvän ruudukon näkyvien ruutujen asettelemista uudestaan
+    seuraavalla piirtokerralla. Kaikkien näkyvien ruutujen avaimet haetaan
+    silloin avainfunktiolta. Kutsu tätä, kun niin moni ruutu on muuttunut,
+    ettei niitä kannata päivittää yksitellen.
+    """
+
+    grafiikka["ruudukko"]["muuttunut"] = True
+    pyyda_piirto()
+
+def sovita_ruudukko():
+    """
+    Laskee ruutujen koon ikkunan ja ruudukon koosta niin, että koko ruudukko
+    mahtuu ikkunaan. Jos ruudut jäisivät liian pieniksi, niiden koko on
+    pienin sallittu ja ruudukkoa katsellaan kameralla.
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    leveys, korkeus = grafiikka["ikkuna"].get_size()
+    sovitus = min(
+        leveys / (ruudukko["leveys"] * ruudukko["koko"]),
+        korkeus / (ruudukko["korkeus"] * ruudukko["koko"])
+    )
+    kamera["zoom"] = min(max(sovitus, PIENIN_SOVITUS), SUURIN_ZOOM)
+    siirra_kameraa(0, 0)
+
+def paivita_ruutu(x, y, avain):
+    """
+    Vaihtaa pysyvän ruudukon yhden ruudun kuvan. Ruudun sijainti annetaan
+    ruutuina, ei pikseleinä. Jos ruutu ei ole näkyvissä tai sen kuva ei muutu,
+    mitään ei tehdä.
+
+    :param int x: ruudun sarake
+    :param int y: ruudun rivi
+    :param str avain: avain, joka valitsee ruudun uuden kuvan
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    x_0, y_0, x_1, y_1 = ruudukko["alue"]
+    if ruudukko["muuttunut"] or not (x_0 <= x < x_1 and y_0 <= y < y_1):
+        return
+    sarakkeet, rivit = ruudukko["mitat"]
+    indeksi = y % rivit * sarakkeet + x % sarakkeet
+    avain = str(avain).lower()
+    if ruudukko["avaimet"][indeksi] != avain:
+        ruudukko["avaimet"][indeksi] = avain
+        ruudukko["spritet"][indeksi].image = grafiikka["kuvat"][avain]
+
+def paivita_valit(valit):
+    """
+    Päivittää pysyvän ruudukon ruutujen kuvat avainfunktion mukaisiksi.
+    Ruudut annetaan väleinä (alku, loppu), joissa ruudun (x, y) indeksi on
+    y * leveys + x ja loppu ei kuulu väliin. Vain näkyvät ruudut päivitetään.
+    Jos välien ruutuja on enemmän kuin ikkunassa näkyy, ruudukko asetellaan
+    sen sijaan uudestaan, joten päivitys maksaa enintään ikkunallisen ruutuja
+    riippumatta siitä, kuinka moni ruutu muuttui.
+
+    :param list valit: päivitettävien ruutujen välit
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    if ruudukko["muuttunut"]:
+        return
+    x_0, y_0, x_1, y_1 = ruudukko["alue"]
+    leveys = ruudukko["leveys"]
+    avainfunktio = ruudukko["avainfunktio"]
+    jaljella = (x_1 - x_0) * (y_1 - y_0)
+    for alku, loppu in valit:
+        jaljella -= loppu - alku
+        if jaljella < 0:
+            pyyda_asettelu()
+            return
+        # Väli voi jatkua usealle riville, joista käydään vain näkyvät.
+        for y in range(max(alku // leveys, y_0), min((loppu - 1) // leveys + 1, y_1)):
+            for x in range(max(alku - y * leveys, x_0), min(loppu - y * leveys, x_1)):
+                paivita_ruutu(x, y, avainfunktio(x, y))
+
+def aseta_savy(x, y, vari=None):
+    """
+    Sävyttää pysyvän ruudukon yhden ruudun annetulla värillä, esimerkiksi
+    vihjeiden näyttämiseksi ruudukon päällä. Ruudun kuvan värit kerrotaan
+    sävyllä, joten valkoinen (255, 255, 255) näyttää kuvan sellaisenaan.
+    Sävy säilyy, vaikka ruudun kuva vaihtuisi tai ruutu vierittyisi pois
+    näkyvistä, kunnes se poistetaan antamalla väriksi None.
+
+    :param int x: ruudun sarake
+    :param int y: ruudun rivi
+    :param tuple vari: sävy kolmena kokonaislukuna (0-255, RGB) tai None
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    if vari is None:
+        ruudukko["savyt"].pop((x, y), None)
+        vari = VALKOINEN
+    else:
+        vari = tuple(vari)
+        ruudukko["savyt"][(x, y)] = vari
+    x_0, y_0, x_1, y_1 = ruudukko["alue"]
+    if ruudukko["muuttunut"] or not (x_0 <= x < x_1 and y_0 <= y < y_1):
+        return
+    sarakkeet, rivit = ruudukko["mitat"]
+    indeksi = y % rivit * sarakkeet + x % sarakkeet
+    if ruudukko["varit"][indeksi] != vari:
+        ruudukko["varit"][indeksi] = vari
+        ruudukko["spritet"][indeksi].color = vari
+
+def piirra_ruudukko():
+    """
+    Piirtää pysyvän ruudukon näkyvät ruudut yhdellä kertaa. Kun kamera liikkuu,
+    vain näkyviin tulleet ruudut asetellaan. Kaikki spritet asetellaan
+    uudestaan vain, jos sitä on pyydetty tai spritevarannon koko muuttuu.
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    alue = _nakyva_alue()
+    mitat = _varannon_mitat(alue)
+    if ruudukko["muuttunut"] or mitat != ruudukko["mitat"]:
+        _asettele_ruudukko(alue, mitat)
+    elif alue != ruudukko["alue"]:
+        _vierita_ruudukko(alue)
+    _kameran_muunnos(True)
+    ruudukko["puskuri"].draw()
+    _kameran_muunnos(False)
+
+def _nakyva_alue():
+    """
+    Palauttaa ikkunassa näkyvien ruutujen alueen kameran perusteella
+    monikkona (x_0, y_0, x_1, y_1), jossa x_1 ja y_1 eivät kuulu alueeseen.
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    koko = ruudukko["koko"]
+    zoom = kamera["zoom"]
+    leveys, korkeus = grafiikka["ikkuna"].get_size()
+    x_0 = max(int(kamera["x"] // koko), 0)
+    y_0 = max(int(kamera["y"] // koko), 0)
+    x_1 = min(int((kamera["x"] + leveys / zoom) // koko) + 1, ruudukko["leveys"])
+    y_1 = min(int((kamera["y"] + korkeus / zoom) // koko) + 1, ruudukko["korkeus"])
+    return x_0, y_0, max(x_1, x_0), max(y_1, y_0)
+
+def _varannon_mitat(alue):
+    """
+    Palauttaa spritevarannon sarakkeiden ja rivien määrän: kuinka monta
+    saraketta ja riviä ikkunassa voi enimmillään näkyä nykyisellä zoomilla.
+    Varanto ei siis muutu kameran liikkuessa, vain zoomatessa ja ikkunan
+    koon muuttuessa.
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    koko = ruudukko["koko"] * kamera["zoom"]
+    leveys, korkeus = grafiikka["ikkuna"].get_size()
+    x_0, y_0, x_1, y_1 = alue
+    # Osittain näkyvä ruutu kummassakin reunassa tuo kaksi ruutua lisää.
+    return (
+        max(min(int(leveys / koko) + 2, ruudukko["leveys"]), x_1 - x_0),
+        max(min(int(korkeus / koko) + 2, ruudukko["korkeus"]), y_1 - y_0)
+    )
+
+def _kameran_muunnos(kaytossa):
+    """
+    Ottaa käyttöön kameran siirron ja zoomauksen näytönohjaimella, tai palauttaa
+    ikkunan tavalliset koordinaatit. Ruudukon spritet ovat paikoillaan
+    zoomaamattomissa koordinaateissa, joten kameran liikkuminen ei muuta niitä.
+    """
+
+    zoom = kamera["zoom"]
+    if PYGLET_2:
+        if kaytossa:
+            grafiikka["ikkuna"].view = (
+                pyglet.math.Mat4.from_scale(pyglet.math.Vec3(zoom, zoom, 1))
+                @ pyglet.math.Mat4.from_translation(pyglet.math.Vec3(-kamera["x"], -kamera["y"], 0))
+            )
+        else:
+            grafiikka["ikkuna"].view = pyglet.math.Mat4()
+    elif kaytossa:
+        pyglet.gl.glPushMatrix()
+        pyglet.gl.glScalef(zoom, zoom, 1)
+        pyglet.gl.glTranslatef(-kamera["x"], -kamera["y"], 0)
+    else:
+        pyglet.gl.glPopMatrix()
+
+def _asettele_ruudukko(alue, mitat):
+    """
+    Sijoittaa ruudukon spritet annetun alueen ruuduille. Spritet ovat
+    varannossa, jossa on mitat-monikon verran sarakkeita ja rivejä, ja ruutu
+    (x, y) näytetään aina varannon sarakkeen x % sarakkeet ja rivin
+    y % rivit spritellä. Näkyvät ruudut osuvat siten aina eri spriteille, ja
+    kameran liikkuessa näkyvistä poistuvan ruudun sprite siirtyy sille
+    ruudulle, joka tulee näkyviin, katso _vierita_ruudukko. Spritejä
+    käytetään uudestaan, ja uusia luodaan vain jos varanto on suurempi kuin
+    koskaan aiemmin.
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    spritet = ruudukko["spritet"]
+    ruudukko["mitat"] = sarakkeet, rivit = mitat
+    while len(spritet) < sarakkeet * rivit:
+        # Kuva vaihdetaan, kun sprite saa ruudun.
+        sprite = pyglet.sprite.Sprite(
+            next(iter(grafiikka["kuvat"].values())), batch=ruudukko["puskuri"]
+        )
+        sprite.visible = False
+        spritet.append(sprite)
+        ruudukko["avaimet"].append(None)
+        ruudukko["varit"].append(VALKOINEN)
+    x_0, y_0, x_1, y_1 = alue
+    for y in range(y_0, y_1):
+        for x in range(x_0, x_1):
+            _nayta_ruutu(ruudukko, x, y)
+    # Piilotetaan spritet, joiden sarake tai rivi ei ole alueella.
+    for indeksi, sprite in enumerate(spritet):
+        if sprite.visible and (
+            indeksi >= sarakkeet * rivit
+            or (indeksi % sarakkeet - x_0) % sarakkeet >= x_1 - x_0
+            or (indeksi // sarakkeet - y_0) % rivit >= y_1 - y_0
+        ):
+            sprite.visible = False
+    ruudukko["alue"] = alue
+    ruudukko["muuttunut"] = False
+
+def _vierita_ruudukko(alue):
+    """
+    Siirtää ruudukon näkyvän alueen, kun spritevarannon koko ei muutu.
+    Vain näkyviin tulevat ruudut haetaan avainfunktiolta ja asetellaan.
+    Näkyvistä poistuneiden ruutujen spritet jäävät paikoilleen ikkunan
+    ulkopuolelle, kunnes jokin näkyviin tuleva ruutu ottaa ne käyttöön.
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    for x, y in _alueiden_erotus(alue, ruudukko["alue"]):
+        _nayta_ruutu(ruudukko, x, y)
+    ruudukko["alue"] = alue
+
+def _alueiden_erotus(alue, pois):
+    """
+    Käy läpi alueen ruudut, jotka eivät kuulu toiseen alueeseen. Alueet
+    annetaan samassa muodossa kuin _nakyva_alue palauttaa ne.
+    """
+
+    x_0, y_0, x_1, y_1 = alue
+    pois_x_0, pois_y_0, pois_x_1, pois_y_1 = pois
+    for y in range(y_0, y_1):
+        if pois_y_0 <= y < pois_y_1:
+            for x in range(x_0, min(x_1, pois_x_0)):
+                yield x, y
+            for x in range(max(x_0, pois_x_1), x_1):
+                yield x, y
+        else:
+            for x in range(x_0, x_1):
+                yield x, y
+
+def _nayta_ruutu(ruudukko, x, y):
+    """
+    Näyttää ruudun (x, y) sille kuuluvalla spritevarannon spritellä: hakee
+    ruudun avaimen ja sävyn ja siirtää spriten ruudun kohdalle.
+    """
+
+    sarakkeet, rivit = ruudukko["mitat"]
+    indeksi = y % rivit * sarakkeet + x % sarakkeet
+    sprite = ruudukko["spritet"][indeksi]
+    avain = str(ruudukko["avainfunktio"](x, y)).lower()
+    if ruudukko["avaimet"][indeksi] != avain:
+        sprite.image = grafiikka["kuvat"][avain]
+        ruudukko["avaimet"][indeksi] = avain
+    vari = ruudukko["savyt"].get((x, y), VALKOINEN)
+    if ruudukko["varit"][indeksi] != vari:
+        sprite.color = vari
+        ruudukko["varit"][indeksi] = vari
+    sprite.update(x=x * ruudukko["koko"], y=y * ruudukko["koko"])
+    if not sprite.visible:
+        sprite.visible = True
+
+def luo_pienoiskartta(leveys, korkeus, rivifunktio, koko=200):
+    """
+    Luo pienoiskartan, joka näyttää koko ruudukon yhtenä kuvana ikkunan
+    oikeassa yläkulmassa, yksi pikseli ruutua kohden. Kuva ladataan
+    näytönohjaimelle yhtenä tekstuurina, joten pienoiskartan piirtäminen
+    maksaa saman verran ruutujen määrästä riippumatta. Kuvan rivit saadaan
+    funktiolta, joka palauttaa rivien y_0 - y_1 (ei mukaan lukien y_1)
+    pikselit tavuina, neljä tavua (RGBA) ruutua kohden alimmasta rivistä
+    alkaen:
+
+    def rivifunktio(y_0, y_1):
+        return bytes(4 * leveys * (y_1 - y_0))
+
+    Muuttuneet rivit merkitään paivita_pienoiskartta-funktiolla, ja ne
+    ladataan uudestaan seuraavalla piirtokerralla. Pienoiskarttaa
+    klikkaamalla kamera siirtyy klikattuun kohtaan.
+
+    :param int leveys: ruudukon leveys ruutuina
+    :param int korkeus: ruudukon korkeus ruutuina
+    :param function rivifunktio: funktio, joka palauttaa rivien pikselit
+    :param int koko: pienoiskartan pidemmän sivun pituus pikseleinä
+    """
+
+    kuva = pyglet.image.ImageData(leveys, korkeus, "RGBA", rivifunktio(0, korkeus))
+    tekstuuri = kuva.get_texture()
+    # Ruudut näkyvät terävinä pikseleinä myös suurennettuina.
+    _terava_tekstuuri(tekstuuri)
+    sprite = pyglet.sprite.Sprite(tekstuuri)
+    sprite.scale = min(koko / leveys, koko / korkeus)
+    grafiikka["pienoiskartta"] = {
+        "tekstuuri": tekstuuri,
+        "sprite": sprite,
+        "rivifunktio": rivifunktio,
+        "leveys": leveys,
+        "korkeus": korkeus,
+        "muuttuneet": None,
+        "nakyvissa": True,
+    }
+
+def poista_pienoiskartta():
+    """
+    Poistaa pienoiskartan käytöstä.
+    """
+
+    grafiikka["pienoiskartta"] = None
+
+def paivita_pienoiskartta(y_0, y_1):
+    """
+    Merkitsee pienoiskartan rivit y_0 - y_1 (ei mukaan lukien y_1)
+    muuttuneiksi. Kaikki muuttuneet rivit ladataan näytönohjaimelle yhdellä
+    kertaa seuraavalla piirtokerralla.
+
+    :param int y_0: ensimmäinen muuttunut rivi
+    :param int y_1: viimeistä muuttunutta riviä seuraava rivi
+    """
+
+    kartta = grafiikka["pienoiskartta"]
+    if kartta is None:
+        return
+    if kartta["muuttuneet"] is not None:
+        y_0 = min(y_0, kartta["muuttuneet"][0])
+        y_1 = max(y_1, kartta["muuttuneet"][1])
+    kartta["muuttuneet"] = (max(y_0, 0), min(y_1, kartta["korkeus"]))
+
+def nayta_pienoiskartta(nakyvissa=None):
+    """
+    Näyttää tai piilottaa pienoiskartan. Ilman argumenttia vaihtaa
+    pienoiskartan näkyvyyttä.
+
+    :param bool nakyvissa: näytetäänkö pienoiskartta
+    """
+
+    kartta = grafiikka["pienoiskartta"]
+    if kartta is not None:
+        kartta["nakyvissa"] = not kartta["nakyvissa"] if nakyvissa is None else nakyvissa
+        pyyda_piirto()
+
+def piirra_pienoiskartta():
+    """
+    Lataa pienoiskartan muuttuneet rivit ja piirtää sen ikkunan oikeaan
+    yläkulmaan. Pienoiskartta tulee piirtää ruudukon jälkeen.
+    """
+
+    kartta = grafiikka["pienoiskartta"]
+    if kartta is None or not kartta["nakyvissa"]:
+        return
+    if kartta["muuttuneet"] is not None:
+        y_0, y_1 = kartta["muuttuneet"]
+        if y_0 < y_1:
+            rivit = pyglet.image.ImageData(
+                kartta["leveys"], y_1 - y_0, "RGBA", kartta["rivifunktio"](y_0, y_1)
+            )
+            kartta["tekstuuri"].blit_into(rivit, 0, y_0, 0)
+        kartta["muuttuneet"] = None
+    sprite = kartta["sprite"]
+    leveys, korkeus = grafiikka["ikkuna"].get_size()
+    sprite.update(
+        x=leveys - sprite.width - PIENOISKARTAN_REUNUS,
+        y=korkeus - sprite.height - PIENOISKARTAN_REUNUS
+    )
+    sprite.draw()
+
+def _pienoiskartan_klikkaus(x, y):
+    """
+    Siirtää kameran pienoiskartalla klikattuun kohtaan. Palauttaa True, jos
+    klikkaus osui pienoiskarttaan.
+    """
+
+    kartta = grafiikka["pienoiskartta"]
+    if kartta is None or not kartta["nakyvissa"]:
+        return False
+    sprite = kartta["sprite"]
+    if not (sprite.x <= x < sprite.x + sprite.width and sprite.y <= y < sprite.y + sprite.height):
+        return False
+    ruudukko = grafiikka["ruudukko"]
+    if ruudukko is not None:
+        koko = ruudukko["koko"]
+        leveys, korkeus = grafiikka["ikkuna"].get_size()
+        zoom = kamera["zoom"]
+        # Klikattu ruutu siirretään ikkunan keskelle.
+        kamera["x"] = (x - sprite.x) / sprite.scale * koko - leveys / zoom / 2
+        kamera["y"] = (y - sprite.y) / sprite.scale * koko - korkeus / zoom / 2
+        siirra_kameraa(0, 0)
+    return True
+
+def ota_kamera_kayttoon(kaytossa=True):
+    """
+    Ottaa ruudukon kameran käyttöön, jolloin ikkunaa suuremman ruudukon eri
+    osia voi katsella. Kameraa liikutetaan raahaamalla hiirellä tai
+    nuolinäppäimillä, ja sitä zoomataan hiiren rullalla tai +- ja --
+    näppäimillä.
+
+    Kun kamera on käytössä, hiiren käsittelijää kutsutaan vasta kun nappi
+    vapautetaan, ja vain jos hiirtä ei raahattu. Käsittelijä saa edelleen
+    ikkunan koordinaatit, jotka muutetaan ruuduiksi ruutu_pisteessa-funktiolla.
+
+    :param bool kaytossa: otetaanko kamera käyttöön vai pois käytöstä
+    """
+
+    if kaytossa and not kamera["kaytossa"]:
+        grafiikka["ikkuna"].push_handlers(
+            on_mouse_drag=_kamera_raahaus,
+            on_mouse_release=_kamera_vapautus,
+            on_mouse_scroll=_kamera_rulla,
+            on_key_press=_kamera_nappain
+        )
+    elif not kaytossa and kamera["kaytossa"]:
+        grafiikka["ikkuna"].remove_handlers(
+            on_mouse_drag=_kamera_raahaus,
+            on_mouse_release=_kamera_vapautus,
+            on_mouse_scroll=_kamera_rulla,
+            on_key_press=_kamera_nappain
+        )
+    kamera["kaytossa"] = kaytossa
+
+def siirra_kameraa(dx, dy):
+    """
+    Siirtää kameraa annetun määrän ikkunan pikseleitä. Kamera ei liiku
+    ruudukon reunojen yli, ja ikkunaa pienempi ruudukko pidetään ikkunan
+    keskellä.
+
+    :param float dx: siirtymä vaakasuunnassa
+    :param float dy: siirtymä pystysuunnassa
+    """
+
+    ruudukko = grafiikka["ruudukko"]
+    leveys, korkeus = grafiikka["ikkuna"].get_size()
+    zoom = kamera["zoom"]
+    vapaa_x = leveys / zoom - ruudukko["leveys"] * ruudukko["koko"]
+    vapaa_y = korkeus / zoom - ruudukko["korkeus"] * ruudukko["koko"]
+    if vapaa_x > 0:
+        kamera["x"] = -vapaa_x / 2
+    else:
+        kamera["x"] = min(max(kamera["x"] + dx / zoom, 0), -vapaa_x)
+    if vapaa_y > 0:
+        kamera["y"] = -vapaa_y / 2
+    else:
+        kamera["y"] = min(max(kamera["y"] + dy / zoom, 0), -vapaa_y)
+    pyyda_piirto()
+
+def zoomaa(kerroin, x=0, y=0):
+    """
+    Muuttaa kameran zoomausta annetulla kertoimella niin, että ikkunan piste
+    (x, y) pysyy paikallaan.
+
+    :param float kerroin: zoomauksen muutos, yli 1 lähentää ja alle 1 loitontaa
+    :param int x: zoomauksen keskipisteen x-koordinaatti ikkunassa
+    :param int y: zoomauksen keskipisteen y-koordinaatti ikkunassa
+    """
+
+    vanha = kamera["zoom"]
+    uusi = min(max(vanha * kerroin, PIENIN_ZOOM), SUURIN_ZOOM)
+    kamera["zoom"] = uusi
+    # Itse valittua zoomausta ei muuteta ikkunan koon muuttuessa.
+    kamera["sovita"] = False
+    kamera["x"] += x / vanha - x / uusi
+    kamera["y"] += y / vanha - y / uusi
+    siirra_kameraa(0, 0)
+
+def ruutu_pisteessa(x, y):
+    """
+    Palauttaa ikkunan pisteessä (x, y) olevan ruudukon ruudun sarakkeen ja
+    rivin. Ruutu voi olla ruudukon ulkopuolella, jos ruudukko on ikkunaa
+    pienempi.
+
+    :param int x: pisteen x-koordinaatti ikkunassa
+    :param int y: pisteen y-koordinaatti ikkunassa
+    :return: ruudun sarake ja rivi monikkona
+    """
+
+    koko = grafiikka["ruudukko"]["koko"]
+    zoom = kamera["zoom"]
+    return (
+        int((kamera["x"] + x / zoom) // koko),
+        int((kamera["y"] + y / zoom) // koko)
+    )
+
+def _kamera_raahaus(x, y, dx, dy, nappi, modit):
+    """
+    Siirtää kameraa hiirellä raahattaessa, kun hiiri on liikkunut tarpeeksi.
+    """
+
+    painallus = kamera["painallus"]
+    if painallus is None:
+        return
+    if not kamera["raahattu"]:
+        if abs(x - painallus[0]) + abs(y - painallus[1]) < RAAHAUSRAJA:
+            return
+        kamera["raahattu"] = True
+        dx, dy = x - painallus[0], y - painallus[1]
+    siirra_kameraa(-dx, -dy)
+
+def _kamera_vapautus(x, y, nappi, modit):
+    """
+    Välittää klikkauksen hiiren käsittelijälle, jos hiirtä ei raahattu.
+    """
+
+    painallus = kamera["painallus"]
+    kamera["painallus"] = None
+    if painallus is not None and not kamera["raahattu"] and kasittelijat["hiiri"]:
+        kasittelijat["hiiri"](*painallus)
+        pyyda_piirto()
+
+def _kamera_rulla(x, y, rulla_x, rulla_y):
+    """
+    Zoomaa kameraa hiiren rullalla hiiren kohdalta.
+    """
+
+    zoomaa(1.25 ** rulla_y, x, y)
+
+def _kamera_nappain(symboli, modit):
+    """
+    Liikuttaa ja zoomaa kameraa näppäimistöllä.
+    """
+
+    leveys, korkeus = grafiikka["ikkuna"].get_size()
+    siirtymat = {
+        pyglet.window.key.LEFT: (-leveys / 4, 0),
+        pyglet.window.key.RIGHT: (leveys / 4, 0),
+        pyglet.window.key.DOWN: (0, -korkeus / 4),
+        pyglet.window.key.UP: (0, korkeus / 4),
+    }
+    if symboli in siirtymat:
+        siirra_kameraa(*siirtymat[symboli])
+    elif symboli in (pyglet.window.key.PLUS, pyglet.window.key.NUM_ADD):
+        zoomaa(1.25, leveys / 2, korkeus / 2)
+    elif symboli in (pyglet.window.key.MINUS, pyglet.window.key.NUM_SUBTRACT):
+        zoomaa(0.8, leveys / 2, korkeus / 2)
+
 if __name__ == "__main__":
     # Poistetaan kaksi pylint-varoitusta pois käytöstä, koska testikoodi
     # antaa ne aiheettomasti
@@ -0,0 +1,217 @@
+"""
+Mine probability hints analysed in a background process.
+
+The solver runs in its own process on a copy of the opened cells, so a
+complex position never takes time from input handling or drawing in the
+game. The process runs this module as its script, so it imports only the
+game engine, never the game script and its graphics library. Messages are
+pickled over the pipes of the process, with a thread serving each pipe so
+that neither side waits for the other.
+
+Each move sends the cells it opened to the process. An analysis still
+running when new cells arrive is cancelled and restarted with them, and
+finished results are collected without waiting.
+"""
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+from board import Board, plane_spans
+from solver import Solver
+
+class HintWorker:
+    """
+    Keeps the hints of a game up to date in a background process: cells
+    known to be safe, cells known to be mines and the mine probabilities of
+    the unknown cells next to opened numbers.
+    """
+
+    def __init__(self, board):
+        self.inbox = queue.Queue() # Messages waiting to be sent to the process
+        self.outbox = queue.Queue() # Results received from the process
+        self.generation = 0 # Updates sent to the process
+        self.analysed = 0 # Updates included in the latest results
+        self.safe = set()
+        self.mines = set()
+        self.probabilities = {}
+        self.process = subprocess.Popen( # pylint: disable=consider-using-with
+            [sys.executable, os.path.abspath(__file__), str(board.width), str(board.height)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self.threads = [
+            threading.Thread(target=_send, args=(self.inbox, self.process.stdin), daemon=True),
+            threading.Thread(target=_receive, args=(self.process.stdout, self.outbox), daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+        self.update(board, plane_spans(board.revealed))
+
+    def update(self, board, spans):
+        """
+        Sends the cells a move changed, as (start, end) spans of flat
+        indexes, to the analysis. Returns the cells whose hints were removed
+        because they were opened.
+        """
+        width = board.width
+        # Flags are not opened, and the mines opened by a lost game are of no
+        # use to the analysis.
+        opened = [
+            (start, end, bytes(board.counts[start:end])) for start, end in spans
+            if board.revealed[start] and not (end - start == 1 and board.mines[start])
+        ]
+        if not opened:
+            return []
+        self.generation += 1
+        self.inbox.put((self.generation, opened, board.safe_cells_left, board.mine_amount))
+        # Whichever is smaller is searched: the opened cells or the hints.
+        if sum(end - start for start, end, _ in opened) <= len(self.safe) + len(self.probabilities):
+            cells = [(i % width, i // width) for start, end, _ in opened for i in range(start, end)]
+        else:
+            cells = list(self.safe) + list(self.probabilities)
+        removed = [
+            (x, y) for x, y in cells
+            if ((x, y) in self.safe or (x, y) in self.probabilities)
+            and board.revealed[y * width + x]
+        ]
+        for cell in removed:
+            self.safe.discard(cell)
+            self.probabilities.pop(cell, None)
+        return removed
+
+    def poll(self):
+        """
+        Collects the results the analysis has finished without waiting.
+        Returns the cells whose hints changed.
+        """
+        changed = set()
+        while True:
+            try:
+                message = self.outbox.get_nowait()
+            except queue.Empty:
+                return changed
+            if message is None:
+                continue
+            generation, (safe, mines, probabilities) = message
+            self.analysed = generation
+            for cell in safe:
+                self.safe.add(cell)
+                self.probabilities.pop(cell, None)
+            for cell in mines:
+                self.mines.add(cell)
+                self.probabilities.pop(cell, None)
+            self.probabilities.update(probabilities)
+            changed.update(safe, mines, probabilities)
+
+    def busy(self):
+        """
+        Returns True if the latest move has not been analysed yet.
+        """
+        return self.analysed < self.generation
+
+    def cells(self):
+        """
+        Returns every cell that has a hint.
+        """
+        return self.safe | self.mines | set(self.probabilities)
+
+    def close(self):
+        """
+        Stops the background process and the threads serving its pipes.
+        """
+        self.inbox.put(None)
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        for thread in self.threads:
+            thread.join()
+        self.process.stdout.close()
+
+def _analyse(width, height, inbox, outbox):
+    """
+    Runs in the background process. Keeps a copy of the opened cells and
+    their counts, and analyses it whenever cells are opened.
+    """
+    board = Board(width, height)
+    solver = Solver(board)
+    while True:
+        message = inbox.get()
+        opened = []
+        generation = None
+        # Updates that arrived during the last analysis are handled at once.
+        while message is not None:
+            generation, spans, board.safe_cells_left, board.mine_amount = message
+            for start, end, counts in spans:
+                board.revealed[start:end] = b"\x01" * (end - start)
+                board.counts[start:end] = counts
+                opened.append((start, end))
+            try:
+                message = inbox.get_nowait()
+            except queue.Empty:
+                break
+        if message is None:
+            return
+        solver.update(opened)
+        outbox.put((generation, solver.analyse(lambda: not inbox.empty())))
+
+class _Output:
+    """
+    Sends the results of the background process to the game through its
+    standard output. Offers the put method of a queue.
+    """
+
+    def __init__(self, target):
+        self.target = target
+
+    def put(self, message):
+        """
+        Sends a message.
+        """
+        pickle.dump(message, self.target)
+        self.target.flush()
+
+def _send(messages, target):
+    """
+    Writes messages from a queue to a pipe until None, then closes the pipe.
+    """
+    try:
+        while True:
+            message = messages.get()
+            if message is None:
+                return
+            pickle.dump(message, target)
+            target.flush()
+    except OSError:
+        # The other end has exited.
+        pass
+    finally:
+        try:
+            target.close()
+        except OSError:
+            pass
+
+def _receive(source, messages):
+    """
+    Reads messages from a pipe to a queue until the pipe closes, then puts
+    None in the queue.
+    """
+    try:
+        while True:
+            messages.put(pickle.load(source))
+    except (EOFError, OSError):
+        messages.put(None)
+
+def _serve(width, height):
+    """
+    Runs the analysis of the background process on the messages from its
+    standard input.
+    """
+    inbox = queue.Queue()
+    threading.Thread(target=_receive, args=(sys.stdin.buffer, inbox), daemon=True).start()
+    _analyse(width, height, inbox, _Output(sys.stdout.buffer))
+
+if __name__ == "__main__":
+    _serve(int(sys.argv[1]), int(sys.argv[2]))
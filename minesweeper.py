@@ -2,52 +2,108 @@
 Final assignment for the Programming 1 course
 in Oulu University made in python by Juuso Kärnä.
 """
-from copy import deepcopy
-import datetime
 import os
+import struct
 import sys
-import random as rnd
+from pyglet.window import key
 import haravasto as h
+from board import Board
+from chunked import MIN_DENSITY
+from hints import HintWorker
+from profiler import Profiler, profiling_enabled
+from savegame import LARGEST_SAVED_BOARD, create_save, resume_game
+from session import GameSession, LARGEST_FLAT_BOARD, PLAYING, WON
+from stats import queue_statistics, show_statistics, statistics_path
 
-START_TIME = None
 STATISTICS_FILE = "stats.txt"
-mines_map = [] # Contains all map information, including mines
-player_map = [] # Used to draw the map to the player, hiding mines ("X")
+SAVE_FILE = "savegame.msv"
+AUTOSAVE_INTERVAL = 10 # Seconds between autosaves of the current game
+HINT_INTERVAL = 1 / 20 # Seconds between checks for finished hints
+MINIMAP_LIMIT = 4096 # Longest map side shown on the minimap
+MAX_WINDOW_SIZE = (1280, 800) # Larger boards are scrolled with the camera
+TILE_SIZE = 40 # Size of a cell in pixels before the grid is scaled to the window
+session = None # Current game, see session.py
+save_file = None # Save file of the current game, see savegame.py
+hints = None # Hints of the current game while they are shown, see hints.py
+# Timings of the current game, see profiler.py
+profile = Profiler(profiling_enabled(sys.argv[1:]))
 
 mouse_keys = {
     h.HIIRI_VASEN:"left",
     h.HIIRI_KESKI:"middle",
     h.HIIRI_OIKEA:"right"
 }
+def minimap_color(code):
+    """
+    Returns the minimap color of a cell code made in minimap_pixels.
+    """
+    if code & 16:
+        if code & 64:
+            return (200, 30, 30, 255)
+        return (
+            (225, 225, 225, 255), (70, 90, 230, 255), (50, 150, 50, 255),
+            (220, 60, 60, 255), (40, 40, 140, 255), (140, 40, 40, 255),
+            (40, 140, 140, 255), (40, 40, 40, 255), (120, 120, 120, 255)
+        )[code & 15]
+    if code & 32:
+        return (255, 150, 0, 255)
+    return (150, 150, 150, 255)
+
+# Translation tables from cell codes to each RGBA channel of the minimap.
+MINIMAP_PALETTE = [
+    bytes(minimap_color(code)[channel] if code & 15 <= 8 else 0 for code in range(256))
+    for channel in range(4)
+]
 menu_choises = {
     "(P)lay": "play",
     "(E)xit": "exit",
     "(S)tatistics": "statistics",
+    "(R)esume": "resume",
     "p": "play",
     "e": "exit",
-    "s": "statistics"
+    "s": "statistics",
+    "r": "resume"
 }
-# Array to store statistics of the current game
-current_game = [
-    None, # Start_time 0
-    None, # Game lenght 1
-    0, # Moves made 2
-    "", # Win or loss 3
-    0, # Mine amount 4
-    0, # Map size x 5
-    0 # Map size y 6
-]
 def main():
     """
     Initialize and display the game graphics, create the game window, 
     and set the necessary event handlers before starting the game.
     """
+    board = session.board
     h.lataa_kuvat('./spritet')
     ## Creates a window relative to the games map size.
-    h.luo_ikkuna(40 * len(mines_map[0]), 40 * len(mines_map))
+    h.luo_ikkuna(min(TILE_SIZE * board.width, MAX_WINDOW_SIZE[0]),
+                 min(TILE_SIZE * board.height, MAX_WINDOW_SIZE[1]))
+    # The cells are scaled to fit the window, also when it is resized.
+    h.luo_ruudukko(board.width, board.height, board.cell_key, TILE_SIZE)
+    h.ota_kamera_kayttoon()
+    # Chunked maps and large resumed maps have no planes to draw the minimap from.
+    if isinstance(board, Board) and max(board.width, board.height) <= MINIMAP_LIMIT:
+        h.luo_pienoiskartta(board.width, board.height, minimap_pixels)
+        # Maps that fit in the window do not need the minimap.
+        h.nayta_pienoiskartta(TILE_SIZE * board.width > MAX_WINDOW_SIZE[0]
+                              or TILE_SIZE * board.height > MAX_WINDOW_SIZE[1])
+    else:
+        h.poista_pienoiskartta()
     h.aseta_piirto_kasittelija(draw_graphics)
     h.aseta_hiiri_kasittelija(mouse_click_event_handler)
+    h.aseta_nappain_kasittelija(key_event_handler)
+    if save_file is not None:
+        h.aseta_toistuva_kasittelija(autosave, AUTOSAVE_INTERVAL)
+    # Redraw only after clicks instead of every frame.
+    h.aseta_piirtotila(True)
     h.aloita()
+    toggle_hints(False)
+    # The window was closed or the game ended.
+    if save_file is None:
+        if session.state() == PLAYING:
+            print("\nThis game was not saved.\n")
+    elif session.state() == PLAYING:
+        save_file.save()
+        save_file.close()
+        print("\nThe game was saved, you can continue it with (R)esume.\n")
+    else:
+        save_file.close(remove=True)
 
 def get_inputs():
     """
@@ -82,6 +138,10 @@ def get_inputs():
             if mine_amount > width * height:
                 print("Mine amount cannot exceed the map size.")
                 mine_amount = 0
+            elif width * height > LARGEST_FLAT_BOARD and mine_amount < width * height * MIN_DENSITY:
+                print("Maps this large need at least {:.0%} of the cells to be mines."
+                      .format(MIN_DENSITY))
+                mine_amount = 0
         except ValueError:
             print("Please give only integers greater than 0.")
     return width, height, mine_amount
@@ -90,199 +150,221 @@ def play_game():
     """
     Initialize and start a new game session.
     """
-    global START_TIME
-    mines_map.clear()
-    player_map.clear()
+    global session, profile, save_file
     width, height, mine_amount = get_inputs()
-    # Save player affected game statistics
-    current_game[5], current_game[6], current_game[4] = width, height, mine_amount
-    current_game[0] = str(datetime.datetime.now().replace(microsecond=0))
-    START_TIME = datetime.datetime.now()
-
-    create_map = []
-    for _ in range(height):
-        create_map.append([])
-        for _ in range(width):
-            create_map[-1].append(" ")
-    mines_map.extend(create_map)
-
-    open_cells = []
-    for x in range(width):
-        for y in range(height):
-            open_cells.append((x, y))
-
-    place_mines(mines_map, open_cells, mine_amount)
-
-    player_map.extend(deepcopy(mines_map))
-    for x, row in enumerate(player_map):
-        for y, _ in enumerate(row):
-            if player_map[x][y] == "x":
-                player_map[x][y] = " "
+    # Mines are placed on the first click so that it never hits a mine.
+    session = GameSession(width, height, mine_amount)
+    profile = Profiler(profile.enabled)
+    save_file = None
+    # Chunked maps are saved with their opened cells and flags only, but
+    # even that does not fit on disk for the largest maps.
+    if width * height <= LARGEST_SAVED_BOARD:
+        if (os.path.exists(statistics_path(SAVE_FILE))
+            and not ask_yes_no("This replaces your saved unfinished game. Start anyway?")):
+            return
+        try:
+            save_file = create_save(session, statistics_path(SAVE_FILE))
+        except (IOError, ValueError):
+            print("Ran into a problem while creating the save file, "
+                  "this game will not be saved.")
     main()
 
-def place_mines(game_map, open_squares, mine_amount):
+def ask_yes_no(question):
     """
-    Randomly place N mines in the game map.
+    Asks the user a yes or no question until the answer is either.
+    Returns True for yes.
     """
-    while not mine_amount == 0:
-        square = rnd.randint(0, len(open_squares) - 1)
-        game_map[(open_squares[square][1])][(open_squares[square][0])] = "x"
-        open_squares.remove(open_squares[square])
-        mine_amount -= 1
+    while True:
+        answer = input(question + " (y/n): ").lower()
+        if answer in ("y", "yes"):
+            return True
+        if answer in ("n", "no"):
+            return False
+        print("Please answer y or n.")
 
-def flood_fill(mine_map, start_x, start_y):
+def resume():
     """
-    Open cells and their neighbors when no neighboring mines are found.
+    Continue the saved game, if there is one.
     """
-    # Check if the starting cell is a mine. Continue or trigger a losing condition.
-    if mine_map[start_y][start_x] == "x":
-        save_statistics(current_game, "./stats.txt", False)
-        print("\nYou lost, you stepped on a mine!\n")
-        h.lopeta()
-        main_menu()
+    global session, profile, save_file
+    if not os.path.exists(statistics_path(SAVE_FILE)):
+        print("There is no saved game to continue.")
         return
-    # Do not flood fill if the cell is not "empty".
-    if check_surrounding_mines(start_x, start_y, mine_map) != 0:
-        mine_map[start_y][start_x] = "0"
+    try:
+        session, save_file = resume_game(statistics_path(SAVE_FILE))
+    except (IOError, ValueError, struct.error):
+        print("Ran into a problem while opening the saved game.")
         return
-    squares = []
-    squares.append((start_x, start_y))
-    while len(squares) > 0:
-        x, y = squares.pop()
-        mine_map[y][x] = "0"
-        if check_surrounding_mines(x, y, mine_map) == 0 or (x == start_x and y == start_y):
-            to_discover = check_squares(x, y, mine_map)
-            # Check if the cell to open is not already in the list
-            # to avoid looping through the same cells multiple times.
-            for i in to_discover:
-                if i not in squares:
-                    squares.append(i)
-
-def check_squares(y, x, space):
-    """
-    Return a list of unopened safe cells around a given point.
-    """
-    safe_squares = []
-    directions = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)]
-    for dir_x, dir_y in directions:
-        cell_x, cell_y = x + dir_x, y + dir_y
-        if (0 <= cell_x < len(space) and 0 <= cell_y < len(space[0])
-            and space[cell_x][cell_y] == ' '):
-            safe_squares.append((cell_y, cell_x))
-    return safe_squares
-
-def check_surrounding_mines(y, x, space):
-    """
-    Returns the amount of neighboring mines.
-    """
-    mine_squares = []
-    directions = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)]
-    for dir_x, dir_y in directions:
-        cell_x, cell_y = x + dir_x, y + dir_y
-        if (0 <= cell_x < len(space) and 0 <= cell_y < len(space[0])
-            and space[cell_x][cell_y] == 'x'):
-            mine_squares.append((cell_y, cell_x))
-    return len(mine_squares)
+    profile = Profiler(profile.enabled)
+    main()
 
 def draw_graphics():
     """
-    Graphics handler that draws the game map to the player based on player_map.
+    Graphics handler that draws the game board to the player, hiding mines.
     """
+    start = profile.start()
     h.tyhjaa_ikkuna()
     h.piirra_tausta()
-    h.aloita_ruutujen_piirto()
-    for x_1, row in enumerate(player_map):
-        for y_1, cell in enumerate(row):
-            h.lisaa_piirrettava_ruutu(cell, y_1 * 40, x_1 * 40)
-    h.piirra_ruudut()
+    h.piirra_ruudukko()
+    h.piirra_pienoiskartta()
+    profile.record("frame", start)
+    if profile.enabled:
+        draw_profile()
+    profile.rendered()
 
-def mouse_click_event_handler(mouse_x, mouse_y, mouse_key_index, _):
+def draw_profile():
     """
-    Mouse event handler for handling left-click and right-click events.
-    Left-click opens a cell, and right-click places or removes a flag.
+    Draws the profiling histograms over the bottom left corner of the window.
     """
-    if str(mouse_keys[mouse_key_index]) == "left":
-        ## We dont explore the cell if there is a flag on it.
-        if not player_map[mouse_y//40][mouse_x//40] == "f":
-            current_game[2] += 1
-            flood_fill(mines_map, mouse_x//40, mouse_y//40)
-        for x, row in enumerate(player_map):
-            for y, _ in enumerate(row):
-                if mines_map[x][y] == "0":
-                    player_map[x][y] = str(check_surrounding_mines(y, x, mines_map))
+    for row, line in enumerate(reversed(profile.lines())):
+        h.piirra_tekstia(line, 5, 5 + 16 * row, fontti="monospace", koko=10)
 
-    if (str(mouse_keys[mouse_key_index]) == "right"
-        and player_map[mouse_y//40][mouse_x//40] == "f"):
-        player_map[mouse_y//40][mouse_x//40] = " "
-    elif (str(mouse_keys[mouse_key_index]) == "right"
-        and player_map[mouse_y//40][mouse_x//40] == " "):
-        player_map[mouse_y//40][mouse_x//40] = "f"
+def update_cells(spans):
+    """
+    Updates the images of the cells in the given (start, end) spans of flat
+    indexes to match the game board.
+    """
+    board = session.board
+    # Only the visible cells are updated, however many changed.
+    h.paivita_valit(spans)
+    if spans:
+        h.paivita_pienoiskartta(min(start for start, _ in spans) // board.width,
+                                (max(end for _, end in spans) - 1) // board.width + 1)
+    if hints is not None:
+        for x, y in hints.update(board, spans):
+            h.aseta_savy(x, y, None)
 
-    if check_win_condition():
-        save_statistics(current_game, "stats.txt", True)
-        print("\nYou won! You found all mines!\n")
-        h.lopeta()
+def minimap_pixels(y_0, y_1):
+    """
+    Returns the minimap pixels of the given rows of the board, four bytes
+    per cell. The planes are combined into one code per cell, the count in
+    the low bits, 16 for opened cells, 32 for flags and 64 for mines, and
+    the codes are turned into colors one channel at a time.
+    """
+    board = session.board
+    start, end = y_0 * board.width, y_1 * board.width
+    # Read as big integers the planes add up byte by byte without carries.
+    codes = (
+        int.from_bytes(board.counts[start:end], "little")
+        + (int.from_bytes(board.revealed[start:end], "little") << 4)
+        + (int.from_bytes(board.flagged[start:end], "little") << 5)
+        + (int.from_bytes(board.mines[start:end], "little") << 6)
+    ).to_bytes(end - start, "little")
+    pixels = bytearray(4 * (end - start))
+    for channel in range(4):
+        pixels[channel::4] = codes.translate(MINIMAP_PALETTE[channel])
+    return bytes(pixels)
 
-def check_win_condition():
+def hint_color(x, y):
     """
-    Checks the games win condition by cheking if all safe cells are opened.
+    Returns the tint of a cell in the hint overlay: green for safe cells,
+    red for mines and a shade of red by mine probability for the rest.
     """
-    while True:
-        for _, row in enumerate(mines_map):
-            for y, _ in enumerate(row):
-                if row[y] == " ":
-                    return False
-        return True
+    if session.board.is_revealed(x, y):
+        return None
+    if (x, y) in hints.safe:
+        return (130, 255, 130)
+    if (x, y) in hints.mines:
+        return (255, 90, 90)
+    probability = hints.probabilities.get((x, y))
+    if probability is None:
+        return None
+    shade = int(255 - 150 * probability)
+    return (255, shade, shade)
 
-def save_statistics(game, file, win):
+def show_hints(_):
     """
-    Saves statistics to a .txt file.
+    Tints the cells whose hints the background analysis has finished.
     """
-    time = (datetime.datetime.now() - START_TIME).total_seconds()
-    current_game[1] = round(float(time), 2)
-    if win:
-        current_game[3] = "Win"
-    else:
-        current_game[3] = "Loss"
-    try:
-        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file)
-        with open(path, "a", encoding='utf-8') as source:
-            for i, stat in enumerate(game):
-                if i < len(game) - 1:
-                    source.write(str(stat) + ", ")
-                else:
-                    source.write(str(stat))
-            source.write("\n")
-    except IOError:
-        print("Ran into a problem while opening the statistics file.")
-    current_game[2] = 0
+    if hints is None:
+        return
+    changed = hints.poll()
+    for x, y in changed:
+        h.aseta_savy(x, y, hint_color(x, y))
+    if changed:
+        h.pyyda_piirto()
 
-def show_statistics(file):
+def toggle_hints(shown):
+    """
+    Starts or stops the background hint analysis and its overlay. Finished
+    hints are only polled for while the analysis runs.
     """
-    Prints statistics from .txt file to the terminal window.
+    global hints
+    if shown and hints is None:
+        hints = HintWorker(session.board)
+        h.aseta_toistuva_kasittelija(show_hints, HINT_INTERVAL)
+    elif not shown and hints is not None:
+        h.poista_toistuva_kasittelija(show_hints)
+        for x, y in hints.cells():
+            h.aseta_savy(x, y, None)
+        hints.close()
+        hints = None
+
+def key_event_handler(symbol, _):
+    """
+    Keyboard event handler. H shows or hides the hint overlay and M the minimap.
+    """
+    # Chunked maps and large resumed maps have no flat planes for the solver to read.
+    if symbol == key.H and isinstance(session.board, Board):
+        toggle_hints(hints is None and session.state() == PLAYING)
+    elif symbol == key.M:
+        h.nayta_pienoiskartta()
+
+def mouse_click_event_handler(mouse_x, mouse_y, mouse_key_index, _):
+    """
+    Mouse event handler for handling left-click, middle-click and right-click events.
+    Left-click opens a cell, right-click places or removes a flag, and
+    middle-click on an opened number with as many flags around it opens
+    the rest of its neighbors at once.
+    """
+    if session.state() != PLAYING:
+        return
+    profile.click()
+    cell_x, cell_y = h.ruutu_pisteessa(mouse_x, mouse_y)
+    start = profile.start()
+    changed = []
+    if str(mouse_keys[mouse_key_index]) == "left":
+        ## Flagged cells are not explored.
+        changed = session.reveal(cell_x, cell_y)
+    if str(mouse_keys[mouse_key_index]) == "right":
+        changed = session.flag(cell_x, cell_y)
+    if str(mouse_keys[mouse_key_index]) == "middle":
+        changed = session.chord(cell_x, cell_y)
+    profile.record("engine", start)
+    start = profile.start()
+    update_cells(changed)
+    profile.record("sprites", start)
+    if save_file is not None:
+        save_file.mark(changed)
+
+    if session.state() != PLAYING:
+        queue_statistics(session.statistics(), STATISTICS_FILE)
+        started = session.start_time.strftime("%Y%m%d_%H%M%S")
+        profile.save(statistics_path("profile_{}.json".format(started)), session.statistics())
+        # A resumed game without its whole move log would replay wrong.
+        if session.log is not None:
+            save_move_log(statistics_path("replay_{}.msl".format(started)))
+        if session.state() == WON:
+            print("\nYou won! You found all mines!\n")
+        else:
+            print("\nYou lost, you stepped on a mine!\n")
+        h.lopeta()
+
+def autosave(_):
+    """
+    Writes the cells changed since the last autosave to the save file.
+    """
+    save_file.save()
+
+def save_move_log(path):
+    """
+    Saves the move log of the game so that it can be replayed with replay.py.
     """
-    statistics = []
     try:
-        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file)
-        with open(path, "r", encoding='utf-8') as source:
-            for row in source.readlines():
-                (play_date, play_time, played_moves, win_state,
-                mines_amount, map_size_x, map_size_y) = row.split(",")
-                game = {
-                    "date": play_date.strip().ljust(20),
-                    "time": play_time.strip().ljust(14),
-                    "moves": played_moves.strip().ljust(8),
-                    "win": win_state.strip().ljust(12),
-                    "mines": mines_amount.strip().ljust(12),
-                    "map_x": map_size_x.strip().ljust(12),
-                    "map_y": map_size_y.strip().ljust(12),
-                }
-                statistics.append(game)
-        for game in statistics:
-            print_value = list(game.values())
-            print(" ".join(print_value))
+        with open(path, "wb") as target:
+            target.write(session.move_log())
     except IOError:
-        print("Ran into a problem while opening the statistics file.")
+        print("Ran into a problem while saving the move log.")
 
 def main_menu():
     """
@@ -309,6 +391,11 @@ def main_menu():
                 show_statistics(STATISTICS_FILE)
         except KeyError:
             pass
+        try:
+            if menu_choises["(R)esume"] == choice or menu_choises[choice] == "resume":
+                resume()
+        except KeyError:
+            pass
         print("Please input only text, and pick from the options provided.")
 
 if __name__ == "__main__":
@@ -0,0 +1,88 @@
+"""
+Compact binary move logs of games.
+
+A log starts with the board size, mine amount and seed, so that the board
+can be made again, followed by one entry per action. An entry holds the
+action type and cell index in one number and the milliseconds since the
+previous action in another. Every number is a varint: 7 bits per byte, with
+the high bit set on every byte but the last, so most entries take 3-4 bytes.
+"""
+import time
+
+MAGIC = b"MSL1"
+REVEAL = 0
+FLAG = 1
+CHORD = 2
+
+class MoveLog:
+    """
+    Records the actions of a game as they are made.
+    """
+    __slots__ = ("actions", "last")
+
+    def __init__(self):
+        self.actions = bytearray()
+        self.last = time.perf_counter()
+
+    def record(self, action, cell):
+        """
+        Adds an action on a flat cell index to the log.
+        """
+        delta = int((time.perf_counter() - self.last) * 1000)
+        # Only whole milliseconds are moved forward, so rounding errors do
+        # not add up over a long game.
+        self.last += delta / 1000
+        write_varint(self.actions, cell << 2 | action)
+        write_varint(self.actions, delta)
+
+def write_varint(buffer, value):
+    """
+    Appends a non-negative integer to a bytearray as a varint.
+    """
+    while value >= 0x80:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def read_varints(data, start=0):
+    """
+    Returns every varint of a bytes object from the given position onwards.
+    """
+    values = []
+    append = values.append
+    value = shift = 0
+    for byte in data[start:]:
+        if byte < 0x80:
+            append(value | byte << shift)
+            value = shift = 0
+        else:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+    if shift:
+        raise ValueError("move log ends in the middle of a number")
+    return values
+
+def encode_log(width, height, mine_amount, seed, actions):
+    """
+    Returns a complete move log from the board settings and recorded actions.
+    """
+    header = bytearray(MAGIC)
+    # Negative seeds are stored as odd numbers.
+    for value in (width, height, mine_amount, seed * 2 if seed >= 0 else -seed * 2 - 1):
+        write_varint(header, value)
+    return bytes(header + actions)
+
+def decode_log(data):
+    """
+    Returns the width, height, mine amount and seed of a move log, and its
+    actions as a flat list of alternating action numbers and time deltas.
+    An action number is cell << 2 | action type.
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a move log")
+    values = read_varints(data, len(MAGIC))
+    if len(values) < 4 or len(values) % 2:
+        raise ValueError("move log is incomplete")
+    width, height, mine_amount, seed = values[:4]
+    seed = seed // 2 if seed % 2 == 0 else -(seed + 1) // 2
+    return width, height, mine_amount, seed, values[4:]
@@ -0,0 +1,154 @@
+"""
+Optional latency and frame time instrumentation for the game.
+
+Profiling is turned on with the MINESWEEPER_PROFILE environment variable or
+the --profile command line flag. Timings are collected into histograms with
+logarithmic buckets, so recording costs the same no matter how many samples
+there are. When profiling is off, every call returns right away.
+"""
+import json
+import math
+import os
+import time
+
+ENVIRONMENT_VARIABLE = "MINESWEEPER_PROFILE"
+BUCKETS_PER_DOUBLING = 4 # Buckets are about 19% apart
+
+def profiling_enabled(arguments=()):
+    """
+    Returns True if profiling was asked for in the environment or with the
+    --profile flag among the given command line arguments.
+    """
+    return "--profile" in arguments or os.environ.get(ENVIRONMENT_VARIABLE, "") not in ("", "0")
+
+class Histogram:
+    """
+    Counts timings into logarithmic buckets of microseconds.
+    """
+    __slots__ = ("buckets", "count", "total", "largest")
+
+    def __init__(self):
+        self.buckets = {} # Bucket number -> amount of timings
+        self.count = 0
+        self.total = 0.0
+        self.largest = 0.0
+
+    def record(self, seconds):
+        """
+        Adds one timing in seconds to the histogram.
+        """
+        bucket = int(math.log2(max(seconds * 1000000, 1)) * BUCKETS_PER_DOUBLING)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.largest:
+            self.largest = seconds
+
+    def percentile(self, share):
+        """
+        Returns the timing in seconds below which the given share of the
+        timings fall, accurate to the bucket.
+        """
+        wanted = share * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return min(2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING) / 1000000, self.largest)
+        return self.largest
+
+    def summary(self):
+        """
+        Returns the amount, mean, median, 99th percentile and largest timing
+        in milliseconds as a dictionary.
+        """
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.largest * 1000,
+        }
+
+class Profiler:
+    """
+    Records the timings of named phases of the game, click to render latency
+    and frame times into histograms. Take a start time with start and pass it
+    to record when the phase ends:
+
+    start = profiler.start()
+    ...
+    profiler.record("engine", start)
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.clicked = None # Time of the click that has not been drawn yet
+
+    def start(self):
+        """
+        Returns the start time of a phase.
+        """
+        if not self.enabled:
+            return 0.0
+        return time.perf_counter()
+
+    def record(self, name, start):
+        """
+        Records the time from a start time to now under the given name.
+        """
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(time.perf_counter() - start)
+
+    def click(self):
+        """
+        Marks the time of a click, to be measured until the next frame is drawn.
+        """
+        if self.enabled and self.clicked is None:
+            self.clicked = time.perf_counter()
+
+    def rendered(self):
+        """
+        Records the latency of the last click once its frame has been drawn.
+        """
+        if self.enabled and self.clicked is not None:
+            self.record("latency", self.clicked)
+            self.clicked = None
+
+    def lines(self):
+        """
+        Returns one line of text per histogram for an on-screen overlay.
+        """
+        return [
+            "{:<8} n={:<6} p50={:.2f}ms p99={:.2f}ms max={:.2f}ms".format(
+                name, stats["count"], stats["p50_ms"], stats["p99_ms"], stats["max_ms"]
+            )
+            for name, stats in ((name, histogram.summary())
+                                for name, histogram in sorted(self.histograms.items()))
+        ]
+
+    def save(self, path, game=None):
+        """
+        Saves the histograms and the statistics row of the game to a JSON file.
+        """
+        if not self.enabled:
+            return
+        try:
+            with open(path, "w", encoding='utf-8') as target:
+                json.dump({
+                    "game": game,
+                    "histograms": {
+                        name: dict(histogram.summary(), buckets={
+                            str(bucket): count
+                            for bucket, count in sorted(histogram.buckets.items())
+                        })
+                        for name, histogram in self.histograms.items()
+                    }
+                }, target, indent=2)
+        except IOError:
+            print("Ran into a problem while saving the profile.")
@@ -0,0 +1,103 @@
+"""
+Replays recorded move logs of games, see movelog.py.
+
+Headless replay runs the actions against the game engine as fast as
+possible, which makes logs usable as benchmark inputs. Window replay shows
+the game in real time, or faster or slower with --speed:
+
+    python replay.py replay_20240101_120000.msl
+    python replay.py replay_20240101_120000.msl --window --speed 4
+"""
+import argparse
+import time
+from movelog import decode_log
+from session import GameSession
+
+def load_log(path):
+    """
+    Reads a move log file.
+    """
+    with open(path, "rb") as source:
+        return source.read()
+
+def replay(data):
+    """
+    Plays the actions of a move log as fast as possible, without recording
+    them again. Returns the game session and the amount of actions played.
+    """
+    width, height, mine_amount, seed, values = decode_log(data)
+    session = GameSession(width, height, mine_amount, seed, record=False)
+    session.replay_actions(values[::2])
+    return session, len(values) // 2
+
+def replay_window(data, speed=1.0):
+    """
+    Plays the actions of a move log in the game window at their recorded
+    pace multiplied by the speed.
+    """
+    import haravasto as h # pylint: disable=import-outside-toplevel
+    from minesweeper import MAX_WINDOW_SIZE, TILE_SIZE # pylint: disable=import-outside-toplevel
+    width, height, mine_amount, seed, values = decode_log(data)
+    session = GameSession(width, height, mine_amount, seed)
+    board = session.board
+    actions = (session.reveal, session.flag, session.chord)
+    state = {"next": 0, "due": values[1] / 1000 if values else 0.0, "clock": 0.0}
+
+    def play(elapsed):
+        state["clock"] += elapsed * speed
+        changed = []
+        while state["next"] < len(values) and state["due"] <= state["clock"]:
+            cell = values[state["next"]] >> 2
+            changed.extend(actions[values[state["next"]] & 3](cell % width, cell // width))
+            state["next"] += 2
+            if state["next"] < len(values):
+                state["due"] += values[state["next"] + 1] / 1000
+        h.paivita_valit(changed)
+        if changed:
+            h.pyyda_piirto()
+
+    def draw():
+        h.tyhjaa_ikkuna()
+        h.piirra_tausta()
+        h.piirra_ruudukko()
+
+    h.lataa_kuvat('./spritet')
+    h.luo_ikkuna(min(TILE_SIZE * width, MAX_WINDOW_SIZE[0]),
+                 min(TILE_SIZE * height, MAX_WINDOW_SIZE[1]))
+    h.luo_ruudukko(width, height, board.cell_key, TILE_SIZE)
+    h.ota_kamera_kayttoon()
+    h.aseta_piirto_kasittelija(draw)
+    h.aseta_toistuva_kasittelija(play)
+    h.aseta_piirtotila(True)
+    h.aloita()
+    return session
+
+def main(arguments=None):
+    """
+    Replays a move log from the command line.
+    """
+    parser = argparse.ArgumentParser(description="Replay a recorded minesweeper game.")
+    parser.add_argument("log", help="move log file")
+    parser.add_argument("--window", action="store_true", help="replay in the game window")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed in window mode")
+    parser.add_argument("--repeat", type=int, default=1, help="headless replays, for benchmarking")
+    options = parser.parse_args(arguments)
+    try:
+        data = load_log(options.log)
+    except IOError:
+        parser.error("cannot read the move log")
+
+    if options.window:
+        session = replay_window(data, options.speed)
+    else:
+        start = time.perf_counter()
+        for _ in range(max(options.repeat, 1)):
+            session, moves = replay(data)
+        elapsed = time.perf_counter() - start
+        print("Replayed {} actions {} times in {:.3f} s, {:.0f} actions per second".format(
+            moves, max(options.repeat, 1), elapsed,
+            moves * max(options.repeat, 1) / elapsed if elapsed else 0.0))
+    print("Result: {}, moves: {}".format(session.result or "unfinished", session.moves))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Saving and resuming unfinished games.
+
+A save file holds a fixed size header with the settings and progress of the
+game, followed by three bitsets of one bit per cell: mines, opened cells and
+flags. The file is kept memory mapped while the game is played, so that an
+autosave only writes the blocks of cells that changed since the last one.
+The move log of the game, see movelog.py, is appended to a file next to
+the save, so that a resumed game can still be replayed from its start.
+
+Small games are resumed whole into memory. Larger games are resumed as a
+MappedBoard, which pages the cells in from the mapped file one chunk at a
+time as they are looked at, so resuming takes the same time for any size
+of board. Chunked games, see chunked.py, are always saved this way, and
+their mines are made again from the seed instead of being saved.
+"""
+import datetime
+import mmap
+import os
+import struct
+import time
+from chunked import CHUNK, ChunkedBoard
+from session import GameSession
+
+MAGIC = b"MSV2"
+# Magic, mines placed, seed given, mines generated from the seed, width,
+# height, mine amount, seed, safe cells left, moves, seconds played, start
+# time as a Unix timestamp and the flat index of the first opened cell.
+# Without a given seed, the mines are placed with a random one.
+HEADER = struct.Struct("<4s???xIIIqqqdqq")
+BLOCK = 4096 # Cells per block written by an autosave, divisible by 8
+LOG_SUFFIX = ".log" # Ending of the move log file next to a save file
+EAGER_RESUME = 10 ** 6 # Cells of the largest game resumed whole into memory
+LARGEST_SAVED_BOARD = 10 ** 9 # Cells of the largest chunked game that is saved
+# Tables that move one bit of a packed byte to its own byte and back.
+UNPACK = [bytes((byte >> bit) & 1 for byte in range(256)) for bit in range(8)]
+PACK = [bytes((byte & 1) << bit for byte in range(256)) for bit in range(8)]
+
+def pack_bits(plane):
+    """
+    Returns a plane of 0 and 1 bytes as a bitset, eight cells per byte and
+    the first cell in the lowest bit.
+    """
+    size = (len(plane) + 7) // 8
+    plane = bytes(plane) + bytes(size * 8 - len(plane))
+    packed = 0
+    # Every eighth cell goes to the same bit of the packed bytes.
+    for bit in range(8):
+        packed |= int.from_bytes(plane[bit::8].translate(PACK[bit]), "little")
+    return packed.to_bytes(size, "little")
+
+def unpack_bits(bitset, cells):
+    """
+    Returns a bitset as a plane of 0 and 1 bytes of the given length.
+    """
+    plane = bytearray(len(bitset) * 8)
+    for bit in range(8):
+        plane[bit::8] = bitset.translate(UNPACK[bit])
+    del plane[cells:]
+    return plane
+
+class MappedBoard(ChunkedBoard):
+    """
+    A chunked board whose opened cells and flags live in a memory mapped
+    save file. The cells of a chunk are read from the file when something
+    first looks at the chunk, and every change is written straight back to
+    it. The mines are either generated from the seed as on any chunked board
+    or, for a resumed flat game, read from the file in the same way.
+    """
+    __slots__ = ("map", "bitset_size", "saved_mines")
+
+    def __init__(self, width, height, data):
+        super().__init__(width, height)
+        self.map = data
+        self.bitset_size = (width * height + 7) // 8
+        self.saved_mines = False
+
+    def use_saved_mines(self, mine_amount, seed):
+        """
+        Uses the mines in the save file instead of generating them.
+        """
+        self.saved_mines = True
+        self.seed = seed
+        self.mine_amount = mine_amount
+        self.safe_cells_left = self.width * self.height - mine_amount
+        self.placed = True
+        self.cache.clear()
+
+    def _generate(self, chunk):
+        """
+        Returns the mine plane of a chunk, read from the file if the mines
+        were saved.
+        """
+        if self.saved_mines:
+            return self._read(0, chunk)
+        return super()._generate(chunk)
+
+    def _read(self, section, chunk):
+        """
+        Returns the plane of a chunk read from one of the bitsets of the file.
+        Each row of the chunk is a run of bits in the file.
+        """
+        x_0, y_0 = chunk[0] * CHUNK, chunk[1] * CHUNK
+        width = min(CHUNK, self.width - x_0)
+        height = min(CHUNK, self.height - y_0)
+        offset = HEADER.size + section * self.bitset_size
+        plane = bytearray(CHUNK * CHUNK)
+        for row in range(height):
+            start = (y_0 + row) * self.width + x_0
+            skip = start % 8
+            packed = self.map[offset + start // 8:offset + (start + width + 7) // 8]
+            plane[row * CHUNK:row * CHUNK + width] = unpack_bits(packed, skip + width)[skip:]
+        return plane
+
+    def _loaded(self, planes, chunk):
+        """
+        Returns the opened cells or flags of a chunk, reading them from the
+        file the first time.
+        """
+        plane = planes.get(chunk)
+        if plane is None:
+            plane = planes[chunk] = self._read(1 if planes is self.revealed else 2, chunk)
+        return plane
+
+    def is_revealed(self, x, y):
+        """
+        Returns True if the cell has been opened.
+        """
+        plane = self._loaded(self.revealed, (x // CHUNK, y // CHUNK))
+        return plane[y % CHUNK * CHUNK + x % CHUNK] == 1
+
+    def is_flagged(self, x, y):
+        """
+        Returns True if the cell has a flag on it.
+        """
+        plane = self._loaded(self.flagged, (x // CHUNK, y // CHUNK))
+        return plane[y % CHUNK * CHUNK + x % CHUNK] == 1
+
+    def _set(self, planes, x, y, value):
+        """
+        Sets a cell of the opened cells or flags, in memory and in the file.
+        """
+        self._loaded(planes, (x // CHUNK, y // CHUNK))
+        super()._set(planes, x, y, value)
+        i = y * self.width + x
+        offset = HEADER.size + (1 if planes is self.revealed else 2) * self.bitset_size + i // 8
+        if value:
+            self.map[offset] |= 1 << i % 8
+        else:
+            self.map[offset] &= 255 ^ 1 << i % 8
+
+class SaveFile:
+    """
+    A memory mapped save file of a game in progress. Mark the cells each
+    move changes and call save to write them.
+    """
+
+    def __init__(self, session, path):
+        board = session.board
+        self.session = session
+        self.path = path
+        self.size = board.width * board.height
+        self.bitset_size = (self.size + 7) // 8
+        self.dirty = set() # Blocks changed since the last save
+        self.mines_saved = board.placed
+        self.file = open(path, "r+b") # pylint: disable=consider-using-with
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        # Actions already in the move log file, which only grows.
+        self.log_saved = len(session.log.actions) if session.log is not None else 0
+        self.log = open(path + LOG_SUFFIX, "ab") # pylint: disable=consider-using-with
+
+    def mark(self, spans):
+        """
+        Marks the cells of (start, end) spans of flat indexes to be written
+        by the next save. A MappedBoard writes its cells itself.
+        """
+        if isinstance(self.session.board, MappedBoard):
+            return
+        for start, end in spans:
+            self.dirty.update(range(start // BLOCK, (end - 1) // BLOCK + 1))
+
+    def save(self):
+        """
+        Writes the header, the changed blocks of the opened cells and flags
+        and the new actions of the move log. The mines are written once,
+        after they have been placed.
+        """
+        board = self.session.board
+        if self.session.log is not None and len(self.session.log.actions) > self.log_saved:
+            self.log.write(self.session.log.actions[self.log_saved:])
+            self.log.flush()
+            self.log_saved = len(self.session.log.actions)
+        self.map[:HEADER.size] = header(self.session)
+        if not self.mines_saved and board.placed and not isinstance(board, MappedBoard):
+            self._write(0, 0, self.size)
+            self.mines_saved = True
+        for block in self.dirty:
+            start = block * BLOCK
+            end = min(start + BLOCK, self.size)
+            self._write(1, start, end)
+            self._write(2, start, end)
+        self.dirty.clear()
+        self.map.flush()
+
+    def close(self, remove=False):
+        """
+        Closes the save file, removing it if asked, for example when the game
+        has ended.
+        """
+        self.map.close()
+        self.file.close()
+        self.log.close()
+        if remove:
+            for path in (self.path, self.path + LOG_SUFFIX):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _write(self, section, start, end):
+        """
+        Writes cells from start to end of a plane to its bitset. The start is
+        always at the start of a packed byte.
+        """
+        board = self.session.board
+        plane = (board.mines, board.revealed, board.flagged)[section]
+        offset = HEADER.size + section * self.bitset_size + start // 8
+        packed = pack_bits(plane[start:end])
+        self.map[offset:offset + len(packed)] = packed
+
+def mines_generated(board):
+    """
+    Returns True if the mines of a board are made from its seed instead of
+    being kept in the save file.
+    """
+    return isinstance(board, ChunkedBoard) and not (
+        isinstance(board, MappedBoard) and board.saved_mines)
+
+def header(session):
+    """
+    Returns the header of a save file of a game.
+    """
+    board = session.board
+    seed = board.seed if board.placed else session.seed
+    first_click = -1
+    if mines_generated(board) and board.first_click is not None:
+        first_click = board.first_click[1] * board.width + board.first_click[0]
+    return HEADER.pack(
+        MAGIC, board.placed, seed is not None, mines_generated(board),
+        board.width, board.height, session.mine_amount, seed if seed is not None else 0,
+        board.safe_cells_left, session.moves, session.elapsed(),
+        int(session.start_time.timestamp()), first_click
+    )
+
+def create_save(session, path):
+    """
+    Writes a whole save file of a game and returns it opened for autosaves.
+    A chunked game is saved before its first move and its board is replaced
+    with a MappedBoard, so the file starts out with empty bitsets.
+    """
+    board = session.board
+    chunked = isinstance(board, ChunkedBoard)
+    if chunked and board.placed:
+        raise ValueError("chunked games are saved before their first move")
+    with open(path, "wb") as target:
+        target.write(header(session))
+        if chunked:
+            # Left as a sparse file on most file systems.
+            target.truncate(HEADER.size + 3 * ((board.width * board.height + 7) // 8))
+        else:
+            for plane in (board.mines, board.revealed, board.flagged):
+                target.write(pack_bits(plane))
+    with open(path + LOG_SUFFIX, "wb") as target:
+        if session.log is not None:
+            target.write(session.log.actions)
+    save = SaveFile(session, path)
+    if chunked:
+        session.board = MappedBoard(board.width, board.height, save.map)
+    return save
+
+def resume_game(path):
+    """
+    Reads a game from a save file. Returns the game session and the save
+    file opened for autosaves. Games larger than EAGER_RESUME cells and
+    chunked games get a MappedBoard, so only the header is read here.
+    If the move log of the game is missing, the session does not record
+    one, since it could not replay the whole game.
+    """
+    with open(path, "rb") as source:
+        (magic, placed, seeded, generated, width, height, mine_amount, seed,
+         safe_cells_left, moves, elapsed, started, first_click) = HEADER.unpack(
+             source.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("not a save file")
+        size = width * height
+        bitset_size = (size + 7) // 8
+        if os.fstat(source.fileno()).st_size < HEADER.size + 3 * bitset_size:
+            raise ValueError("save file is incomplete")
+        # A flat game without mines has nothing to page in.
+        mapped = generated or (placed and size > EAGER_RESUME)
+        if not mapped:
+            planes = [unpack_bits(source.read(bitset_size), size) for _ in range(3)]
+    session = GameSession(width, height, mine_amount, seed if seeded else None)
+    if mapped:
+        save = SaveFile(session, path)
+        board = session.board = MappedBoard(width, height, save.map)
+        if placed and generated:
+            click = (first_click % width, first_click // width) if first_click >= 0 else None
+            board.place_mines(mine_amount, seed, click)
+        elif placed:
+            board.use_saved_mines(mine_amount, seed)
+    else:
+        board = session.board
+        if placed:
+            board.set_mines(planes[0], seed=seed)
+        board.revealed = planes[1]
+        board.flagged = planes[2]
+    board.safe_cells_left = safe_cells_left
+    session.moves = moves
+    session.started = time.perf_counter() - elapsed
+    session.start_time = datetime.datetime.fromtimestamp(started)
+    try:
+        with open(path + LOG_SUFFIX, "rb") as source:
+            session.log.actions = bytearray(source.read())
+    except IOError:
+        session.log = None
+    if not mapped:
+        save = SaveFile(session, path)
+    return session, save
@@ -0,0 +1,216 @@
+"""
+Headless minesweeper game session.
+
+This module does not depend on pyglet, so games can be played, simulated
+and analysed without a display, and many sessions can live in one process.
+"""
+import datetime
+import time
+from board import Board
+from chunked import ChunkedBoard
+from movelog import MoveLog, REVEAL, FLAG, CHORD, encode_log
+
+PLAYING = "playing"
+WON = "won"
+LOST = "lost"
+# Cells of the largest board kept whole in memory. A flat board takes four
+# bytes per cell and about as much again while its counts are computed.
+LARGEST_FLAT_BOARD = 10 ** 7
+
+class GameSession:
+    """
+    One game of minesweeper: the board, moves made, timing and outcome.
+    Mines are placed on the first opened cell so that it is always safe.
+    Boards larger than LARGEST_FLAT_BOARD are generated in chunks as they
+    are explored, see chunked.py.
+    """
+
+    def __init__(self, width, height, mine_amount, seed=None, record=True):
+        if width * height > LARGEST_FLAT_BOARD:
+            self.board = ChunkedBoard(width, height)
+        else:
+            self.board = Board(width, height)
+        self.mine_amount = mine_amount
+        self.seed = seed
+        self.moves = 0
+        self.start_time = datetime.datetime.now().replace(microsecond=0)
+        self.started = time.perf_counter()
+        self.duration = None
+        self.result = None # "Win" or "Loss" once the game has ended
+        self.log = MoveLog() if record else None # Actions of the game, see movelog.py
+
+    def state(self):
+        """
+        Returns the state of the game: "playing", "won" or "lost".
+        """
+        if self.result == "Win":
+            return WON
+        if self.result == "Loss":
+            return LOST
+        return PLAYING
+
+    def elapsed(self):
+        """
+        Returns the length of the game in seconds so far.
+        """
+        if self.duration is not None:
+            return self.duration
+        return time.perf_counter() - self.started
+
+    def reveal(self, x, y):
+        """
+        Opens a cell, flood filling empty areas. Opening a mine loses the game
+        and opening the last safe cell wins it.
+        Returns the cells that changed as (start, end) spans of flat indexes.
+        """
+        board = self.board
+        if self.result is not None or not board.in_bounds(x, y) or board.is_flagged(x, y):
+            return []
+        if self.log is not None:
+            self.log.record(REVEAL, y * board.width + x)
+        self.moves += 1
+        if not board.placed:
+            board.place_mines(self.mine_amount, self.seed, (x, y))
+        if board.is_mine(x, y):
+            board.reveal(x, y)
+            self._finish(False)
+            return [(y * board.width + x, y * board.width + x + 1)]
+        opened = board.flood_fill(x, y)
+        if board.all_safe_cells_opened():
+            self._finish(True)
+        return opened
+
+    def flag(self, x, y):
+        """
+        Places or removes a flag on an unopened cell.
+        Returns the cells that changed as (start, end) spans of flat indexes.
+        """
+        board = self.board
+        if self.result is not None or not board.in_bounds(x, y) or board.is_revealed(x, y):
+            return []
+        if self.log is not None:
+            self.log.record(FLAG, y * board.width + x)
+        board.toggle_flag(x, y)
+        return [(y * board.width + x, y * board.width + x + 1)]
+
+    def chord(self, x, y):
+        """
+        Opens every unflagged neighbor of an opened number whose flag count
+        matches the number. Returns the cells that changed as (start, end)
+        spans of flat indexes.
+        """
+        board = self.board
+        if (self.result is not None or not board.in_bounds(x, y)
+            or not board.is_revealed(x, y) or board.is_mine(x, y)):
+            return []
+        neighbors = board.neighbors(x, y)
+        flags = sum(1 for cell_x, cell_y in neighbors if board.is_flagged(cell_x, cell_y))
+        if flags != board.count(x, y):
+            return []
+        if self.log is not None:
+            self.log.record(CHORD, y * board.width + x)
+        self.moves += 1
+        changed = []
+        for cell_x, cell_y in neighbors:
+            if board.is_flagged(cell_x, cell_y) or board.is_revealed(cell_x, cell_y):
+                continue
+            if board.is_mine(cell_x, cell_y):
+                board.reveal(cell_x, cell_y)
+                i = cell_y * board.width + cell_x
+                changed.append((i, i + 1))
+                self._finish(False)
+            else:
+                changed.extend(board.flood_fill(cell_x, cell_y))
+        if self.result is None and board.all_safe_cells_opened():
+            self._finish(True)
+        return changed
+
+    def replay_actions(self, actions):
+        """
+        Plays the action numbers of a move log, cell << 2 | action type,
+        without recording them again. On flat boards reveals and flags work
+        on the planes directly and opened cells are skipped, without the
+        checks the reveal and flag methods make for input from the player.
+        The first reveal, chords and opened mines still go through those
+        methods.
+        """
+        board = self.board
+        if not isinstance(board, Board):
+            methods = (self.reveal, self.flag, self.chord)
+            for value in actions:
+                cell = value >> 2
+                methods[value & 3](cell % board.width, cell // board.width)
+            return
+        width, size = board.width, len(board.mines)
+        mines, revealed, flagged, counts = board.mines, board.revealed, board.flagged, board.counts
+        moves = 0
+        for value in actions:
+            cell = value >> 2
+            action = value & 3
+            if action == REVEAL:
+                if cell >= size or flagged[cell]:
+                    continue
+                if revealed[cell]:
+                    moves += 1
+                elif not board.placed or mines[cell]:
+                    self.moves += moves
+                    moves = 0
+                    self.reveal(cell % width, cell // width)
+                    if self.result is not None:
+                        return
+                else:
+                    moves += 1
+                    if counts[cell]:
+                        revealed[cell] = 1
+                        board.safe_cells_left -= 1
+                    else:
+                        board.flood_fill(cell % width, cell // width)
+                    if not board.safe_cells_left:
+                        self.moves += moves
+                        self._finish(True)
+                        return
+            elif action == FLAG:
+                if cell < size and not revealed[cell]:
+                    flagged[cell] ^= 1
+            else:
+                self.moves += moves
+                moves = 0
+                self.chord(cell % width, cell // width)
+                if self.result is not None:
+                    return
+        self.moves += moves
+
+    def statistics(self):
+        """
+        Returns the statistics row of the game: start time, duration, moves,
+        win or loss, mine amount, map width and map height. Chunked boards
+        round the mine amount of each chunk, so once the mines are placed
+        the amount on the board is reported.
+        """
+        board = self.board
+        return [
+            str(self.start_time),
+            round(float(self.elapsed()), 2),
+            self.moves,
+            self.result or "",
+            board.mine_amount if board.placed else self.mine_amount,
+            board.width,
+            board.height
+        ]
+
+    def move_log(self):
+        """
+        Returns the move log of the game: the board settings and seed
+        followed by every action, from which the game can be replayed.
+        """
+        board = self.board
+        seed = board.seed if board.placed else self.seed
+        actions = self.log.actions if self.log is not None else b""
+        return encode_log(board.width, board.height, self.mine_amount, seed or 0, actions)
+
+    def _finish(self, win):
+        """
+        Ends the game and stops the clock.
+        """
+        self.duration = time.perf_counter() - self.started
+        self.result = "Win" if win else "Loss"
@@ -0,0 +1,143 @@
+"""
+Batch simulation of minesweeper games without the graphical interface.
+
+Plays a range of seeded games with a playing strategy across a process pool
+and reports the win rate, average moves and throughput, for example:
+
+    python simulate.py 30 16 99 --games 10000 --strategy random
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import random as rnd
+import time
+from session import GameSession, PLAYING
+from solver import Solver
+from stats import save_statistics_rows
+
+# A strategy is a generator that yields actions as ("reveal", x, y),
+# ("flag", x, y) or ("chord", x, y) and is sent the cells each action changed.
+
+def random_strategy(session, rng):
+    """
+    Opens random unopened cells.
+    """
+    board = session.board
+    size = board.width * board.height
+    while True:
+        i = int(rng.random() * size)
+        if not board.revealed[i] and not board.flagged[i]:
+            yield "reveal", i % board.width, i // board.width
+
+def solver_strategy(session, rng):
+    """
+    Starts from the middle and then opens cells the solver knows to be safe,
+    guessing the least likely mine when there are none.
+    """
+    board = session.board
+    solver = Solver(board)
+    changed = yield "reveal", board.width // 2, board.height // 2
+    while True:
+        solver.update(changed)
+        solver.analyse()
+        changed = yield ("reveal",) + solver.guess(rng)
+
+STRATEGIES = {
+    "random": random_strategy,
+    "solver": solver_strategy,
+}
+
+def play_games(width, height, mine_amount, seeds, strategy):
+    """
+    Plays one game per seed with the given strategy.
+    Returns the statistics rows of the games.
+    """
+    rows = []
+    for seed in seeds:
+        session = GameSession(width, height, mine_amount, seed, record=False)
+        actions = STRATEGIES[strategy](session, rnd.Random(seed))
+        changed = None
+        while session.state() == PLAYING:
+            action, x, y = actions.send(changed)
+            if action == "reveal":
+                changed = session.reveal(x, y)
+            elif action == "flag":
+                changed = session.flag(x, y)
+            else:
+                changed = session.chord(x, y)
+        rows.append(session.statistics())
+    return rows
+
+def _play_chunk(arguments):
+    """
+    Plays a chunk of games in a worker process.
+    """
+    return play_games(*arguments)
+
+def simulate(width, height, mine_amount, seeds, strategy="random", workers=None, chunk_size=None):
+    """
+    Plays one game per seed across a process pool. Seeds are handed out in
+    chunks so that workers stay busy without a round trip for every game.
+    Returns the statistics rows of the games in seed order.
+    """
+    seeds = list(seeds)
+    workers = workers or os.cpu_count() or 1
+    if not chunk_size:
+        chunk_size = max(1, min(1000, len(seeds) // (workers * 8)))
+    chunks = [
+        (width, height, mine_amount, seeds[i:i + chunk_size], strategy)
+        for i in range(0, len(seeds), chunk_size)
+    ]
+    rows = []
+    if workers == 1:
+        for chunk in chunks:
+            rows.extend(_play_chunk(chunk))
+        return rows
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_rows in executor.map(_play_chunk, chunks):
+            rows.extend(chunk_rows)
+    return rows
+
+def report(rows, elapsed):
+    """
+    Prints the win rate, average moves and throughput of simulated games.
+    """
+    games = len(rows)
+    wins = sum(1 for row in rows if row[3] == "Win")
+    moves = sum(row[2] for row in rows)
+    print("Games played: {}".format(games))
+    if games:
+        print("Win rate: {:.2%}".format(wins / games))
+        print("Average moves: {:.2f}".format(moves / games))
+    print("Throughput: {:.1f} games per second".format(games / elapsed if elapsed else 0.0))
+
+def main(arguments=None):
+    """
+    Runs a batch simulation from the command line.
+    """
+    parser = argparse.ArgumentParser(description="Simulate minesweeper games in parallel.")
+    parser.add_argument("width", type=int, help="map width")
+    parser.add_argument("height", type=int, help="map height")
+    parser.add_argument("mines", type=int, help="amount of mines")
+    parser.add_argument("--games", type=int, default=1000, help="amount of games to play")
+    parser.add_argument("--first-seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="random")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=None, help="games per work unit")
+    parser.add_argument("--output", default=None, help="statistics file to append the games to")
+    options = parser.parse_args(arguments)
+    if options.width <= 0 or options.height <= 0 or options.games < 0:
+        parser.error("map size and game amount must be positive")
+    if not 0 < options.mines <= options.width * options.height:
+        parser.error("mine amount must be between 1 and the map size")
+
+    seeds = range(options.first_seed, options.first_seed + options.games)
+    start = time.perf_counter()
+    rows = simulate(options.width, options.height, options.mines, seeds,
+                    options.strategy, options.workers, options.chunk_size)
+    report(rows, time.perf_counter() - start)
+    if options.output:
+        save_statistics_rows(rows, options.output)
+
+if __name__ == "__main__":
+    main()
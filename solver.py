@@ -0,0 +1,367 @@
+"""
+Minesweeper solver that works on the cells visible to the player.
+
+The solver keeps the frontier, the opened numbered cells next to unknown
+cells, up to date as cells are opened, so each update only costs time for
+the cells that changed. Deductions use single-cell and subset rules first
+and fall back to exact enumeration over independent frontier components.
+"""
+from collections import deque
+from math import exp, lgamma
+from board import DIRECTIONS, plane_spans
+
+ENUMERATION_LIMIT = 32 # Largest amount of unknown cells enumerated at once
+
+class Solver:
+    """
+    Finds safe cells, sure mines and mine probabilities of a board from the
+    opened cells only. Call update with the spans of cells each move opened
+    and then analyse to get what changed. The full results are kept in the mines,
+    safe and probabilities attributes as flat cell indexes.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.mines = set() # Unopened cells known to be mines
+        self.safe = set() # Unopened cells known to be safe
+        self.frontier = set() # Opened numbered cells next to unknown cells
+        self.probabilities = {} # Mine probability of unknown cells next to the frontier
+        self.expected_mines = 0.0 # Sum of the probabilities
+        self.dirty = set() # Frontier cells that changed since the last analysis
+        self.safe_queue = deque() # Safe cells in the order they were found
+        self.found = ([], [], {}) # Results of the analysis in progress
+        self.update(plane_spans(board.revealed))
+
+    def update(self, spans):
+        """
+        Updates the frontier after the cells of the given (start, end) spans
+        of flat indexes have been opened.
+        """
+        board = self.board
+        revealed, counts, mines = board.revealed, board.counts, board.mines
+        for start, end in spans:
+            for i in range(start, end):
+                self.safe.discard(i)
+                self._forget(i)
+                if mines[i]:
+                    continue
+                if counts[i] > 0:
+                    self.frontier.add(i)
+                    self.dirty.add(i)
+                for j in self._neighbors(i):
+                    if revealed[j] and j in self.frontier:
+                        self.dirty.add(j)
+
+    def analyse(self, cancelled=None):
+        """
+        Deduces what can be deduced from the changed part of the frontier.
+        Returns the safe cells and sure mines found by this call and the
+        mine probabilities that changed, so the cost of a call depends on
+        what changed and not on the size of the board.
+
+        If a cancelled function is given, it is called between the frontier
+        components, and once it returns True the analysis stops with what it
+        has found so far. The rest is analysed by the next call.
+        """
+        self.found = ([], [], {})
+        while self.dirty and not (cancelled is not None and cancelled()):
+            touched = set()
+            while self.dirty:
+                i = self.dirty.pop()
+                touched.add(i)
+                if not self._single_rule(i):
+                    self._subset_rule(i)
+            # Enumeration may mark cells, which queues more frontier cells.
+            for component, cells in self._components(touched):
+                if cancelled is not None and cancelled():
+                    self.dirty.update(touched)
+                    break
+                self._enumerate(component, cells)
+        width = self.board.width
+        safe, mines, probabilities = self.found
+        return (
+            [(i % width, i // width) for i in safe],
+            [(i % width, i // width) for i in mines],
+            {(i % width, i // width): p for i, p in probabilities.items()}
+        )
+
+    def interior_probability(self):
+        """
+        Returns the mine probability of unknown cells that are not next to
+        the frontier, from the mines not yet accounted for.
+        """
+        board = self.board
+        unknown = (board.safe_cells_left - len(self.safe)
+                   + board.mine_amount - len(self.mines))
+        interior = unknown - len(self.probabilities)
+        if interior <= 0:
+            return 0.0
+        left = board.mine_amount - len(self.mines) - self.expected_mines
+        return min(max(left / interior, 0.0), 1.0)
+
+    def probability(self, x, y):
+        """
+        Returns the mine probability of a cell.
+        """
+        i = y * self.board.width + x
+        if self.board.revealed[i] or i in self.safe:
+            return 0.0
+        if i in self.mines:
+            return 1.0
+        return self.probabilities.get(i, self.interior_probability())
+
+    def guess(self, rng):
+        """
+        Returns a known safe cell, or else the unknown cell least likely to be
+        a mine. Interior cells are picked at random.
+        """
+        width = self.board.width
+        while self.safe_queue:
+            i = self.safe_queue[0]
+            if i in self.safe:
+                return i % width, i // width
+            self.safe_queue.popleft()
+        best, lowest = None, self.interior_probability()
+        for i, p in self.probabilities.items():
+            if p < lowest:
+                best, lowest = i, p
+        if best is None:
+            best = self._random_interior(rng)
+        if best is None and self.probabilities:
+            best = min(self.probabilities, key=self.probabilities.get)
+        return best % width, best // width
+
+    def _random_interior(self, rng):
+        """
+        Returns a random unknown cell that is not next to the frontier.
+        """
+        board = self.board
+        size = board.width * board.height
+        candidates = (board.safe_cells_left - len(self.safe)
+                      + board.mine_amount - len(self.mines) - len(self.probabilities))
+        if candidates <= 0:
+            return None
+        while True:
+            i = int(rng.random() * size)
+            if (not board.revealed[i] and i not in self.mines and i not in self.safe
+                and i not in self.probabilities):
+                return i
+
+    def _neighbors(self, i):
+        """
+        Returns the flat indexes of the cells next to a cell.
+        """
+        width, height = self.board.width, self.board.height
+        x, y = i % width, i // width
+        cells = []
+        for dir_x, dir_y in DIRECTIONS:
+            cell_x, cell_y = x + dir_x, y + dir_y
+            if 0 <= cell_x < width and 0 <= cell_y < height:
+                cells.append(cell_y * width + cell_x)
+        return cells
+
+    def _constraint(self, i):
+        """
+        Returns the unknown cells next to a frontier cell and the amount of
+        mines among them.
+        """
+        revealed = self.board.revealed
+        unknown = []
+        mines = self.board.counts[i]
+        for j in self._neighbors(i):
+            if j in self.mines:
+                mines -= 1
+            elif not revealed[j] and j not in self.safe:
+                unknown.append(j)
+        return unknown, mines
+
+    def _single_rule(self, i):
+        """
+        Marks the unknown cells next to a frontier cell when the cell alone
+        decides them. Returns True if something was marked.
+        """
+        unknown, mines = self._constraint(i)
+        if not unknown:
+            self.frontier.discard(i)
+            return False
+        if mines == 0:
+            self._mark(unknown, False)
+            return True
+        if mines == len(unknown):
+            self._mark(unknown, True)
+            return True
+        return False
+
+    def _subset_rule(self, i):
+        """
+        Compares a frontier cell with the frontier cells around it. When the
+        unknown cells of one are a subset of the other, the cells left over
+        hold the difference of their mines.
+        """
+        unknown, mines = self._constraint(i)
+        unknown = set(unknown)
+        others = set()
+        for j in unknown:
+            others.update(k for k in self._neighbors(j) if k in self.frontier and k != i)
+        for k in others:
+            other_unknown, other_mines = self._constraint(k)
+            other_unknown = set(other_unknown)
+            for small, small_mines, large, large_mines in (
+                (unknown, mines, other_unknown, other_mines),
+                (other_unknown, other_mines, unknown, mines)
+            ):
+                if small and small < large:
+                    rest = large - small
+                    if large_mines - small_mines == 0:
+                        self._mark(rest, False)
+                        return
+                    if large_mines - small_mines == len(rest):
+                        self._mark(rest, True)
+                        return
+
+    def _mark(self, cells, mine):
+        """
+        Marks unknown cells as mines or as safe and queues the frontier cells
+        next to them for another look.
+        """
+        for j in cells:
+            if mine:
+                self.mines.add(j)
+                self.found[1].append(j)
+            else:
+                self.safe.add(j)
+                self.safe_queue.append(j)
+                self.found[0].append(j)
+            self._forget(j)
+            for k in self._neighbors(j):
+                if k in self.frontier:
+                    self.dirty.add(k)
+
+    def _forget(self, i):
+        """
+        Drops the probability of a cell that is no longer unknown.
+        """
+        p = self.probabilities.pop(i, None)
+        if p is not None:
+            self.expected_mines -= p
+
+    def _components(self, touched):
+        """
+        Yields the frontier components that contain touched frontier cells,
+        as their frontier cells and unknown cells. Frontier cells belong to
+        the same component when they share unknown cells.
+        """
+        seen = set()
+        for start in touched:
+            if start in seen or start not in self.frontier:
+                continue
+            seen.add(start)
+            component, cells = [start], []
+            known_cells = set()
+            stack = [start]
+            while stack:
+                i = stack.pop()
+                for j in self._constraint(i)[0]:
+                    if j in known_cells:
+                        continue
+                    known_cells.add(j)
+                    cells.append(j)
+                    for k in self._neighbors(j):
+                        if k in self.frontier and k not in seen:
+                            seen.add(k)
+                            component.append(k)
+                            stack.append(k)
+            if cells:
+                yield component, cells
+
+    def _enumerate(self, component, cells):
+        """
+        Counts every mine arrangement of a frontier component to get exact
+        mine probabilities for its unknown cells. Components too large to
+        enumerate get a local estimate instead.
+        """
+        constraints = [self._constraint(i) for i in component]
+        if len(cells) > ENUMERATION_LIMIT:
+            for unknown, mines in constraints:
+                for j in unknown:
+                    self._set_probability(j, mines / len(unknown))
+            return
+        position = {j: n for n, j in enumerate(cells)}
+        # Constraints of each cell, as [cells left to decide, mines left].
+        state = [[len(unknown), mines] for unknown, mines in constraints]
+        of_cell = [[] for _ in cells]
+        for c, (unknown, _) in enumerate(constraints):
+            for j in unknown:
+                of_cell[position[j]].append(c)
+        totals = {} # Mine amount -> amount of arrangements
+        cell_totals = {} # Mine amount -> mine counts of each cell
+        assignment = [0] * len(cells)
+
+        def search(n, mines):
+            if n == len(cells):
+                totals[mines] = totals.get(mines, 0) + 1
+                counts = cell_totals.setdefault(mines, [0] * len(cells))
+                for m, value in enumerate(assignment):
+                    counts[m] += value
+                return
+            for value in (0, 1):
+                fits = True
+                for c in of_cell[n]:
+                    left, mines_left = state[c]
+                    if mines_left - value < 0 or mines_left - value > left - 1:
+                        fits = False
+                        break
+                if not fits:
+                    continue
+                for c in of_cell[n]:
+                    state[c][0] -= 1
+                    state[c][1] -= value
+                assignment[n] = value
+                search(n + 1, mines + value)
+                for c in of_cell[n]:
+                    state[c][0] += 1
+                    state[c][1] += value
+            assignment[n] = 0
+
+        search(0, 0)
+        if not totals:
+            return
+        weights = self._weights(totals, len(cells))
+        total = sum(weights[k] * totals[k] for k in totals)
+        for m, j in enumerate(cells):
+            if all(cell_totals[k][m] == 0 for k in totals):
+                self._mark([j], False)
+            elif all(cell_totals[k][m] == totals[k] for k in totals):
+                self._mark([j], True)
+            else:
+                weighted = sum(weights[k] * cell_totals[k][m] for k in totals)
+                self._set_probability(j, weighted / total)
+
+    def _weights(self, totals, size):
+        """
+        Returns the relative weight of arrangements by their mine amount.
+        Arrangements with fewer mines leave more ways to place the rest of the
+        mines in the interior, so they are weighted by the amount of those ways.
+        """
+        board = self.board
+        unknown = (board.safe_cells_left - len(self.safe)
+                   + board.mine_amount - len(self.mines))
+        interior = max(unknown - size, 0)
+        left = board.mine_amount - len(self.mines)
+        logs = {}
+        for k in totals:
+            rest = left - k
+            if 0 <= rest <= interior:
+                logs[k] = lgamma(interior + 1) - lgamma(rest + 1) - lgamma(interior - rest + 1)
+        if not logs:
+            return {k: 1.0 for k in totals}
+        largest = max(logs.values())
+        return {k: exp(logs[k] - largest) if k in logs else 0.0 for k in totals}
+
+    def _set_probability(self, i, p):
+        """
+        Stores the mine probability of an unknown cell.
+        """
+        self.expected_mines += p - self.probabilities.get(i, 0.0)
+        self.probabilities[i] = p
+        self.found[2][i] = p
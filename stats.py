@@ -0,0 +1,440 @@
+"""
+Statistics of played games, stored in a .txt file with one game per row:
+start time, duration, moves, win or loss, mine amount, map width and map height.
+
+The .txt file has two small sidecar files: a page index with the byte
+offset of every page of games, so any page can be shown by seeking to it,
+and a summary cache of games and wins by board configuration. Both are
+updated from the appended rows only.
+
+Every game is also stored in an indexed SQLite database next to the .txt
+file, which answers aggregate questions (win rates, medians, best times)
+without reading every row:
+
+    python stats.py summary
+    python stats.py best 30 16 99
+"""
+import argparse
+import array
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    start_time TEXT,
+    duration REAL,
+    moves INTEGER,
+    result TEXT,
+    mines INTEGER,
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS games_result_duration ON games (width, height, mines, result, duration);
+CREATE INDEX IF NOT EXISTS games_duration ON games (width, height, mines, duration);
+CREATE INDEX IF NOT EXISTS games_moves ON games (width, height, mines, moves);
+CREATE INDEX IF NOT EXISTS games_result ON games (result);
+"""
+
+def statistics_path(file):
+    """
+    Returns the path of a statistics file, relative to this file.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), file)
+
+def database_path(file):
+    """
+    Returns the path of the database that belongs to a statistics file.
+    """
+    return os.path.splitext(statistics_path(file))[0] + ".db"
+
+def index_path(file):
+    """
+    Returns the path of the page index that belongs to a statistics file.
+    """
+    return os.path.splitext(statistics_path(file))[0] + ".idx"
+
+def summary_path(file):
+    """
+    Returns the path of the summary cache that belongs to a statistics file.
+    """
+    return os.path.splitext(statistics_path(file))[0] + ".summary.json"
+
+PAGE_SIZE = 20 # Games shown on one page of statistics
+OFFSET_SIZE = 8 # Bytes of one page offset in the page index
+FLUSH_INTERVAL = 1.0 # Seconds the writer waits to collect rows into one batch
+
+class StatisticsWriter:
+    """
+    Saves statistics rows on a background thread so that a slow disk never
+    blocks the game. Rows queued within the flush interval are written as
+    one batch with one open and one write per file.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self.rows = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def save(self, game, file):
+        """
+        Queues a statistics row of a game to be saved to a file.
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.rows.put((file, list(game)))
+
+    def flush(self):
+        """
+        Waits until every queued row has been written.
+        """
+        if self.thread is not None:
+            self.rows.join()
+
+    def close(self):
+        """
+        Writes every queued row and stops the background thread.
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.rows.put(None)
+            thread.join()
+
+    def _run(self):
+        """
+        Collects queued rows into batches and writes them until closed.
+        """
+        while True:
+            item = self.rows.get()
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while item is not None:
+                batch.append(item)
+                try:
+                    item = self.rows.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            files = {}
+            for file, game in batch:
+                files.setdefault(file, []).append(game)
+            for file, games in files.items():
+                save_statistics_rows(games, file)
+            for _ in batch:
+                self.rows.task_done()
+            if item is None:
+                self.rows.task_done()
+                return
+
+writer = StatisticsWriter()
+# Queued rows are written before the program exits normally.
+atexit.register(writer.close)
+
+def queue_statistics(game, file):
+    """
+    Saves a statistics row of a game in the background without waiting for
+    the disk.
+    """
+    writer.save(game, file)
+
+def save_statistics(game, file):
+    """
+    Saves a statistics row of a game to a .txt file.
+    """
+    save_statistics_rows([game], file)
+
+def save_statistics_rows(games, file):
+    """
+    Saves statistics rows of many games to a .txt file with a single write,
+    and to the statistics database.
+    """
+    # The database is opened first, so that a new database does not import
+    # these games from the .txt file and then record them again.
+    try:
+        connection = open_database(file)
+    except sqlite3.Error:
+        connection = None
+        print("Ran into a problem while opening the statistics database.")
+    try:
+        with open(statistics_path(file), "a", encoding='utf-8') as source:
+            source.write("".join(format_row(game) for game in games))
+        update_summary(file)
+    except IOError:
+        print("Ran into a problem while opening the statistics file.")
+    if connection is not None:
+        try:
+            with connection:
+                record_games(connection, games)
+        except sqlite3.Error:
+            print("Ran into a problem while writing the statistics database.")
+        connection.close()
+
+def format_row(game):
+    """
+    Returns a statistics row as a line of the statistics file.
+    """
+    return ", ".join(str(stat) for stat in game) + "\n"
+
+def parse_row(line):
+    """
+    Returns a line of the statistics file as a typed statistics row,
+    or None if the line is not a game (for example the header line).
+    """
+    fields = [field.strip() for field in line.split(",")]
+    if len(fields) != 7:
+        return None
+    try:
+        return [fields[0], float(fields[1]), int(fields[2]), fields[3],
+                int(fields[4]), int(fields[5]), int(fields[6])]
+    except ValueError:
+        return None
+
+summary_lock = threading.Lock()
+
+def _load_summary(file):
+    """
+    Returns the summary cache of a statistics file, or an empty summary if
+    the cache is missing or does not match the file and its page index.
+    """
+    empty = {"size": 0, "games": 0, "configurations": {}}
+    try:
+        with open(summary_path(file), "r", encoding='utf-8') as source:
+            cache = json.load(source)
+        pages = os.path.getsize(index_path(file)) // OFFSET_SIZE
+        if (cache["size"] > os.path.getsize(statistics_path(file))
+            or pages != -(-cache["games"] // PAGE_SIZE)):
+            return empty
+    except (IOError, ValueError, KeyError, TypeError):
+        return empty
+    return cache
+
+def update_summary(file):
+    """
+    Brings the page index and the summary cache of a statistics file up to
+    date by reading only the rows appended since the last update.
+    Returns the summary as a dictionary of the games and of games and wins
+    by board configuration.
+    """
+    with summary_lock:
+        cache = _load_summary(file)
+        start = offset = cache["size"]
+        offsets = array.array("q")
+        configurations = cache["configurations"]
+        with open(statistics_path(file), "rb") as source:
+            source.seek(start)
+            for line in source:
+                if not line.endswith(b"\n"):
+                    break # A row that is still being written
+                row = parse_row(line.decode("utf-8", "replace"))
+                if row is not None:
+                    if cache["games"] % PAGE_SIZE == 0:
+                        offsets.append(offset)
+                    cache["games"] += 1
+                    key = "{} {} {}".format(row[5], row[6], row[4])
+                    games, wins = configurations.get(key, (0, 0))
+                    configurations[key] = [games + 1, wins + (row[3] == "Win")]
+                offset += len(line)
+        if offset == start and start:
+            return cache
+        cache["size"] = offset
+        # The index is written first: if the cache write never happens,
+        # the index no longer matches the cache and both are rebuilt.
+        with open(index_path(file), "ab" if start else "wb") as index:
+            offsets.tofile(index)
+        temporary = summary_path(file) + ".tmp"
+        with open(temporary, "w", encoding='utf-8') as target:
+            json.dump(cache, target)
+        os.replace(temporary, summary_path(file))
+        return cache
+
+def read_page(file, page):
+    """
+    Returns the statistics rows on a page of a statistics file, found by
+    seeking through the page index instead of reading the earlier rows.
+    """
+    with open(index_path(file), "rb") as index:
+        index.seek(page * OFFSET_SIZE)
+        offset = array.array("q")
+        offset.frombytes(index.read(OFFSET_SIZE))
+    games = []
+    if not offset:
+        return games
+    with open(statistics_path(file), "rb") as source:
+        source.seek(offset[0])
+        for line in source:
+            row = parse_row(line.decode("utf-8", "replace"))
+            if row is not None:
+                games.append(row)
+                if len(games) == PAGE_SIZE:
+                    break
+    return games
+
+def open_database(file):
+    """
+    Opens the statistics database of a statistics file. When the database
+    is created, the games already in the .txt file are imported into it.
+    """
+    path = database_path(file)
+    created = not os.path.exists(path)
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    if created:
+        with connection:
+            import_statistics(connection, file)
+    return connection
+
+def record_games(connection, games):
+    """
+    Inserts statistics rows into the database.
+    """
+    connection.executemany(
+        "INSERT INTO games (start_time, duration, moves, result, mines, width, height) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (list(game) for game in games)
+    )
+
+def import_statistics(connection, file):
+    """
+    Imports the games of a statistics .txt file into the database.
+    Returns the amount of imported games.
+    """
+    try:
+        with open(statistics_path(file), "r", encoding='utf-8') as source:
+            games = [row for row in map(parse_row, source) if row is not None]
+    except IOError:
+        return 0
+    record_games(connection, games)
+    return len(games)
+
+def summary(connection):
+    """
+    Returns the games, wins, win rate, median duration and median moves
+    of every board configuration as rows of
+    (width, height, mines, games, wins, win rate, median duration, median moves).
+    """
+    rows = []
+    for width, height, mines, games, wins in connection.execute(
+        "SELECT width, height, mines, COUNT(*), SUM(result = 'Win') FROM games "
+        "GROUP BY width, height, mines ORDER BY width, height, mines"
+    ):
+        configuration = (width, height, mines)
+        rows.append(configuration + (
+            games, wins, wins / games,
+            _median(connection, "duration", configuration, games),
+            _median(connection, "moves", configuration, games)
+        ))
+    return rows
+
+def _median(connection, column, configuration, games):
+    """
+    Returns the median of a column within one board configuration by
+    seeking to the middle of its index.
+    """
+    query = ("SELECT {0} FROM games WHERE width = ? AND height = ? AND mines = ? "
+             "ORDER BY {0} LIMIT ? OFFSET ?").format(column)
+    values = [value for (value,) in connection.execute(
+        query, configuration + (2 - games % 2, (games - 1) // 2)
+    )]
+    return sum(values) / len(values)
+
+def best_times(connection, width, height, mines, limit=10):
+    """
+    Returns the fastest won games of a board configuration as rows of
+    (start time, duration, moves).
+    """
+    return connection.execute(
+        "SELECT start_time, duration, moves FROM games "
+        "WHERE width = ? AND height = ? AND mines = ? AND result = 'Win' "
+        "ORDER BY duration LIMIT ?",
+        (width, height, mines, limit)
+    ).fetchall()
+
+def show_statistics(file):
+    """
+    Prints a summary of the statistics in a .txt file to the terminal window
+    and lets the player page through the games.
+    """
+    # Games still waiting in the background are shown too.
+    writer.flush()
+    try:
+        cache = update_summary(file)
+        games = cache["games"]
+        wins = sum(wins for _, wins in cache["configurations"].values())
+        print("Games: {}   Wins: {}   Win rate: {:.2%}".format(
+            games, wins, wins / games if games else 0.0))
+        print("Width  Height Mines  Games    Wins     Win rate")
+        for key, (played, won) in sorted(
+            cache["configurations"].items(),
+            key=lambda item: [int(value) for value in item[0].split()]
+        ):
+            width, height, mines = key.split()
+            print("{:<6} {:<6} {:<6} {:<8} {:<8} {:.2%}".format(
+                width, height, mines, played, won, won / played))
+        pages = -(-games // PAGE_SIZE)
+        page = 0
+        while pages:
+            print()
+            print("Start time           Duration(s)    Moves    Win/Loss     "
+                  "Mine amount  Map width    Map height")
+            for game in read_page(file, page):
+                print(" ".join(str(stat).ljust(width) for stat, width
+                               in zip(game, (20, 14, 8, 12, 12, 12, 12))))
+            if pages == 1:
+                break
+            try:
+                choice = input("Page {}/{}. (N)ext, (P)revious, a page number or (Q)uit: "
+                               .format(page + 1, pages)).strip().lower()
+            except EOFError:
+                break
+            if choice in ("n", ""):
+                if page == pages - 1:
+                    break
+                page += 1
+            elif choice == "p":
+                page = max(page - 1, 0)
+            elif choice.isdigit():
+                page = min(max(int(choice) - 1, 0), pages - 1)
+            elif choice == "q":
+                break
+            else:
+                print("Please pick from the options provided.")
+    except IOError:
+        print("Ran into a problem while opening the statistics file.")
+
+def main(arguments=None):
+    """
+    Prints aggregate statistics from the command line.
+    """
+    parser = argparse.ArgumentParser(description="Aggregate minesweeper statistics.")
+    parser.add_argument("--file", default="stats.txt", help="statistics file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("summary", help="win rate and medians by board configuration")
+    best = commands.add_parser("best", help="best times of a board configuration")
+    best.add_argument("width", type=int)
+    best.add_argument("height", type=int)
+    best.add_argument("mines", type=int)
+    best.add_argument("--limit", type=int, default=10)
+    options = parser.parse_args(arguments)
+
+    connection = open_database(options.file)
+    if options.command == "summary":
+        print("Width  Height Mines  Games    Wins     Win rate Median time  Median moves")
+        for width, height, mines, games, wins, rate, duration, moves in summary(connection):
+            print("{:<6} {:<6} {:<6} {:<8} {:<8} {:<8.2%} {:<12.2f} {:.1f}".format(
+                width, height, mines, games, wins, rate, duration, moves))
+    else:
+        for start_time, duration, moves in best_times(
+            connection, options.width, options.height, options.mines, options.limit
+        ):
+            print("{:<20} {:<10.2f} {}".format(start_time, duration, moves))
+    connection.close()
+
+if __name__ == "__main__":
+    main()